@@ -0,0 +1,198 @@
+"""Response cache for read-only endpoints.
+
+Cache keys embed a version token for every model the view depends on.
+The receivers in api.signals replace the token after the writing
+transaction commits, so a write makes every dependent response
+unreachable without scanning the cache. Tokens are random, not
+counters. A token that is lost, whether culled or overwritten by a
+concurrent bump, is replaced by a new one and never reused, so an old
+response can not become reachable again. The tokens live in their own
+VERSION_CACHE_ALIAS cache, apart from the response bodies that get
+culled.
+
+A model can have scoped versions besides its main one. Recipe counters
+are the 'counters' scope of Recipe: a favorite or a cart toggle only
+reaches the responses ordered by a counter, see cache_counter_fields.
+Users have versions of their own, 'state' for their favorites, cart
+entries and subscriptions and 'cart' for their cart totals.
+
+A token starts with the hex Unix time it was made at, so a set of
+tokens also tells when the data behind it last changed.
+"""
+import hashlib
+import re
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from . import replicas
+
+CACHE_ALIAS = 'responses'
+VERSION_CACHE_ALIAS = 'versions'
+
+stats = Counter()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_version_cache():
+    return caches[VERSION_CACHE_ALIAS]
+
+
+def new_version():
+    return f'{int(time.time()):x}-{uuid.uuid4().hex[:12]}'
+
+
+def version_time(versions):
+    """Newest Unix time of the tokens in a version string, or None."""
+    times = []
+    for token in re.split('[.:]', versions):
+        made, dash, _ = token.partition('-')
+        if dash:
+            try:
+                times.append(int(made, 16))
+            except ValueError:
+                pass
+    return max(times, default=None)
+
+
+def model_label(model, scope=None):
+    label = model._meta.label_lower
+    return f'{label}:{scope}' if scope else label
+
+
+def version_key(model, scope=None):
+    return f'version:{model_label(model, scope)}'
+
+
+def written_key(model, scope=None):
+    return f'written:{model_label(model, scope)}'
+
+
+def bump_version(model, scope=None):
+    cache = get_version_cache()
+    cache.set(version_key(model, scope), new_version(), timeout=None)
+    if replicas.get_replicas():
+        cache.set(
+            written_key(model, scope), True,
+            timeout=replicas.get_sticky_seconds()
+        )
+
+
+def user_version_key(user_id, scope):
+    return f'version:user:{user_id}:{scope}'
+
+
+def bump_user_versions(user_ids, scope):
+    get_version_cache().set_many({
+        user_version_key(user_id, scope): new_version()
+        for user_id in user_ids
+    }, timeout=None)
+
+
+def get_tokens(keys, found=None):
+    """Tokens of the keys, new ones for the keys that are missing.
+
+    found holds tokens already read from the version cache.
+    """
+    cache = get_version_cache()
+    tokens = cache.get_many(keys) if found is None else dict(found)
+    for key in keys:
+        if key not in tokens:
+            cache.add(key, new_version(), timeout=None)
+            tokens[key] = cache.get(key)
+    return [str(tokens[key]) for key in keys]
+
+
+def get_user_version(user_id, scope):
+    return get_tokens([user_version_key(user_id, scope)])[0]
+
+
+def get_versions(models, scope=None):
+    """Version part of a cache key for responses built from the models.
+
+    While a replica may still lag behind a write to one of the models,
+    the rest of the request reads the default database, so the response
+    cached under the new version is not built from stale rows.
+    """
+    cache = get_version_cache()
+    keys = [version_key(model, scope) for model in models]
+    lag_keys = (
+        [written_key(model, scope) for model in models]
+        if replicas.current.get() else []
+    )
+    found = cache.get_many(keys + lag_keys)
+    if any(key in found for key in lag_keys):
+        replicas.use_primary()
+    return '.'.join(get_tokens(keys, found))
+
+
+class CachedResponseMixin:
+    """Caches list and retrieve responses of a read-only viewset.
+
+    cache_models lists the models the response is built from. With
+    cache_anonymous_only the response depends on the current user, so
+    only anonymous requests are served from the cache. Responses ordered
+    by one of cache_counter_fields also depend on the counters of the
+    queryset model.
+    """
+    cache_models = ()
+    cache_anonymous_only = False
+    cache_counter_fields = ()
+
+    def get_cache_versions(self, request):
+        versions = get_versions(self.cache_models)
+        ordering = request.query_params.get('ordering', '')
+        if any(field in ordering for field in self.cache_counter_fields):
+            versions += ':' + get_versions(
+                (self.queryset.model, ), 'counters'
+            )
+        return versions
+
+    def get_cache_bucket(self, request):
+        if not self.cache_anonymous_only:
+            return 'any'
+        return None if request.user.is_authenticated else 'anon'
+
+    def get_cache_key(self, request, bucket):
+        params = '&'.join(
+            f'{name}={value}'
+            for name, values in sorted(request.query_params.lists())
+            for value in sorted(values)
+        )
+        digest = hashlib.sha1(
+            f'{request.get_host()}{request.path}?{params}'.encode()
+        ).hexdigest()
+        return (f'response:{self.__class__.__name__}.{self.action}:'
+                f'{self.get_cache_versions(request)}:{bucket}:{digest}')
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        bucket = self.get_cache_bucket(request)
+        if bucket is None:
+            return handler(request, *args, **kwargs)
+        view_name = f'{self.__class__.__name__}.{self.action}'
+        cache = get_cache()
+        key = self.get_cache_key(request, bucket)
+        data = cache.get(key)
+        if data is not None:
+            stats[f'{view_name}.hit'] += 1
+            return Response(data, headers={'X-Cache': 'HIT'})
+        stats[f'{view_name}.miss'] += 1
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_user_version, version_time
+
+
+class ConditionalRecipeMixin:
+    """ETag and Last-Modified for recipe list and retrieve.
+
+    The validator is computed before the view runs, so a matching
+    If-None-Match or If-Modified-Since gets 304 before any serializer.
+    It is the latest updated_at of the filtered recipes, one aggregate
+    on an indexed column, plus version tokens from the cache: those of
+    the response cache (deletes, tags, ingredients, thumbnails and, for
+    lists ordered by them, counters) and, for a signed-in user, the
+    'state' version of their favorites, cart entries and subscriptions.
+    Tokens carry the time they were made at, so Last-Modified moves with
+    them too. Meant to be used with CachedResponseMixin.
+    """
+
+    def get_validators(self, request, queryset):
+        last_modified = queryset.order_by().values('updated_at').aggregate(
+            last_modified=Max('updated_at')
+        )['last_modified']
+        if last_modified is None:
+            return None, None
+        versions = self.get_cache_versions(request)
+        if request.user.is_authenticated:
+            versions += ':' + get_user_version(request.user.pk, 'state')
+        digest = hashlib.sha1(
+            f'{request.get_full_path()}|{request.accepted_renderer.format}|'
+            f'{request.user.pk}|{last_modified.isoformat()}|{versions}'
+            .encode()
+        ).hexdigest()
+        last_modified = max(
+            int(last_modified.timestamp()), version_time(versions) or 0
+        )
+        return quote_etag(digest), last_modified
+
+    def conditional_response(self, handler, queryset, request,
+                             *args, **kwargs):
+        etag, last_modified = self.get_validators(request, queryset)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, self.filter_queryset(self.get_queryset()),
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset().filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        return self.conditional_response(
+            super().retrieve, queryset, request, *args, **kwargs
+        )
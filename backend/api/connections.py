@@ -0,0 +1,66 @@
+"""Persistent database connection checks.
+
+Django 3.2 reuses a connection for CONN_MAX_AGE seconds but does not
+notice one the server or a proxy has dropped meanwhile; the first query
+of the next request fails. With DB_CONN_HEALTH_CHECKS a connection that
+has been idle for more than DB_CONN_HEALTH_CHECK_IDLE seconds since the
+last request released it is pinged when a request starts, and closed if
+the ping fails, so the request reconnects. Servers and proxies drop idle
+connections, so connections in steady use are not pinged and a busy
+worker pays no extra round trip; 0 pings on every request.
+"""
+import os
+import time
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from django.core import checks
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+# Connection wrapper: monotonic time the last request released it.
+_released = WeakKeyDictionary()
+
+
+def check_connections(**kwargs):
+    if not getattr(settings, 'DB_CONN_HEALTH_CHECKS', False):
+        return
+    idle_after = time.monotonic() - getattr(
+        settings, 'DB_CONN_HEALTH_CHECK_IDLE', 0
+    )
+    for connection in connections.all():
+        if (connection.connection is not None
+                and not connection.in_atomic_block
+                and _released.get(connection, 0) <= idle_after
+                and not connection.is_usable()):
+            connection.close()
+
+
+def release_connections(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            _released[connection] = now
+
+
+@checks.register()
+def check_connection_budget(app_configs, **kwargs):
+    """Every gunicorn thread keeps its own connection to each database."""
+    limit = getattr(settings, 'DB_MAX_CONNECTIONS', None)
+    if not limit:
+        return []
+    needed = (int(os.getenv('GUNICORN_WORKERS', default=1))
+              * int(os.getenv('GUNICORN_THREADS', default=1)))
+    if needed <= limit:
+        return []
+    return [checks.Warning(
+        f'GUNICORN_WORKERS x GUNICORN_THREADS = {needed} соединений с '
+        f'каждой базой, а DB_MAX_CONNECTIONS = {limit}.',
+        hint='Уменьшите число воркеров или потоков, либо увеличьте '
+             'max_connections базы или пула pgbouncer.',
+        id='api.W001',
+    )]
+
+
+request_started.connect(check_connections)
+request_finished.connect(release_connections)
@@ -0,0 +1,55 @@
+"""Materialized subscription timelines for users who follow many authors.
+
+For such users the Follow semi-join is the expensive part of the feed,
+so the newest FEED_TIMELINE_SIZE (pub_date, id) pairs are cached for
+FEED_TIMELINE_TIMEOUT seconds. The entry is tied to the Recipe response
+cache version and dropped when the user follows or unfollows someone.
+The follows are counted only when there is no entry: users below
+FEED_TIMELINE_THRESHOLD get a LIGHT entry instead of a timeline, and an
+outdated timeline is rebuilt without recounting.
+"""
+from django.conf import settings
+
+from recipes.models import Follow, Recipe
+
+from .cache import get_cache, get_versions
+
+# Cached instead of a timeline for users who follow too few authors.
+LIGHT = 'light'
+
+
+def timeline_key(user_id):
+    return f'feed:{user_id}'
+
+
+def invalidate_timeline(user_id):
+    get_cache().delete(timeline_key(user_id))
+
+
+def get_timeline(user, queryset):
+    """Cached timeline of the user, or None if it is not worth caching."""
+    cache = get_cache()
+    key = timeline_key(user.pk)
+    version = get_versions((Recipe, ))
+    timeout = getattr(settings, 'FEED_TIMELINE_TIMEOUT', 60)
+    timeline = cache.get(key)
+    if timeline == LIGHT:
+        return None
+    if timeline is not None and timeline['version'] == version:
+        return timeline
+    threshold = getattr(settings, 'FEED_TIMELINE_THRESHOLD', 1000)
+    if (timeline is None
+            and Follow.objects.filter(user=user).count() < threshold):
+        cache.set(key, LIGHT, timeout)
+        return None
+    size = getattr(settings, 'FEED_TIMELINE_SIZE', 500)
+    entries = list(queryset.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id'
+    )[:size])
+    timeline = {
+        'version': version,
+        'entries': entries,
+        'complete': len(entries) < size,
+    }
+    cache.set(key, timeline, timeout)
+    return timeline
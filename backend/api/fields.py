@@ -0,0 +1,125 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.exceptions import ValidationError
+
+from recipes import images
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField that decodes into a temporary file.
+
+    The payload is decoded in CHUNK_SIZE slices straight to disk, so the
+    request worker holds the base64 string from the parsed JSON body and
+    one chunk, never a second full-size copy. Images above
+    IMAGE_MAX_PIXELS are rejected from the header, before any pixel data
+    is decoded.
+    """
+    CHUNK_SIZE = 256 * 1024
+
+    def decode_to_file(self, payload):
+        if len(payload) % 4:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        upload = TemporaryUploadedFile(
+            uuid.uuid4().hex, None, 0, None
+        )
+        try:
+            for start in range(0, len(payload), self.CHUNK_SIZE):
+                upload.write(base64.b64decode(
+                    payload[start:start + self.CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            upload.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
+
+    def check_image(self, upload):
+        try:
+            with Image.open(upload.temporary_file_path()) as image:
+                file_format = (image.format or '').lower()
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            upload.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = 'jpg' if file_format == 'jpeg' else file_format
+        if extension not in self.ALLOWED_TYPES:
+            upload.close()
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if width * height > getattr(
+                settings, 'IMAGE_MAX_PIXELS', 25_000_000):
+            upload.close()
+            raise ValidationError('Слишком большое изображение.')
+        upload.name = f'{upload.name}.{extension}'
+        upload.content_type = Image.MIME.get(file_format.upper())
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES or not isinstance(data, str):
+            return super().to_internal_value(data)
+        payload = data.partition(';base64,')[2] or data
+        upload = self.decode_to_file(payload)
+        self.check_image(upload)
+        upload.seek(0)
+        return serializers.ImageField.to_internal_value(self, upload)
+
+
+class ImageSetField(serializers.ReadOnlyField):
+    """Thumbnail renditions of an image field, null until rendered."""
+
+    def to_representation(self, value):
+        image_set = images.get_image_set(value)
+        request = self.context.get('request')
+        if image_set is None or request is None:
+            return image_set
+        return [
+            {
+                key: request.build_absolute_uri(url)
+                if isinstance(url, str) else url
+                for key, url in rendition.items()
+            }
+            for rendition in image_set
+        ]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Resolves all primary keys of the list with one query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        queryset = self.child_relation.get_queryset()
+        pk_field = queryset.model._meta.pk
+        try:
+            pks = [pk_field.to_python(pk) for pk in data]
+        except DjangoValidationError:
+            self.child_relation.fail(
+                'incorrect_type', data_type=type(data[0]).__name__
+            )
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that does not query per item with many=True."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
@@ -1,22 +1,72 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django import forms
+from django.db.models import Exists, OuterRef, Q
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, Recipe, Tag
 from users.models import CustomUser
 
 
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    return (
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('text', weight='B', config='russian')
+    )
+
+
+class SlugsField(forms.MultipleChoiceField):
+
+    def valid_value(self, value):
+        return True
+
+
+class SlugsFilter(filters.MultipleChoiceFilter):
+    field_class = SlugsField
+
+
 class RecipeFilter(filters.FilterSet):
+    TAGS_ANY = 'any'
+    TAGS_ALL = 'all'
+
     author = filters.ModelChoiceFilter(queryset=CustomUser.objects.all())
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = SlugsFilter(method='get_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_ANY, TAGS_ANY), (TAGS_ALL, TAGS_ALL)),
+        method='skip_filter'
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'tags_mode', 'search')
+
+    def skip_filter(self, queryset, name, value):
+        return queryset
+
+    def get_tags(self, queryset, name, value):
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        if self.form.cleaned_data.get('tags_mode') == self.TAGS_ALL:
+            for slug in set(value):
+                queryset = queryset.filter(Exists(recipe_tags.filter(
+                    tag_id__in=Tag.objects.filter(slug=slug).values('id')
+                )))
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(
+            tag_id__in=Tag.objects.filter(slug__in=value).values('id')
+        )))
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value is True:
@@ -29,10 +79,33 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(customers__user=user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        if not is_postgresql(queryset):
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        return queryset.annotate(
+            search_vector=recipe_search_vector(),
+            search_rank=SearchRank(recipe_search_vector(), query)
+        ).filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).order_by('-search_rank', '-pub_date')
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='startswith')
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Ingredient
-        fields = ('name', )
+        fields = ('name', 'search')
+
+    def get_search(self, queryset, name, value):
+        if not is_postgresql(queryset):
+            return queryset.filter(name__startswith=value)
+        return queryset.annotate(
+            similarity=TrigramSimilarity('name', value)
+        ).filter(
+            Q(name__trigram_similar=value) | Q(name__icontains=value)
+        ).order_by('-similarity', 'name')
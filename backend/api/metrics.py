@@ -0,0 +1,130 @@
+"""Per-request query, latency and size metrics.
+
+Enabled with METRICS_ENABLED. InstrumentationMiddleware measures every
+request and TimedSerializerMixin adds the time spent in the serializers
+of the current request. The totals are kept per process and exposed in
+the Prometheus text format at /api/metrics/; with several workers every
+scrape sees the process that served it.
+"""
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+
+from . import cache
+
+current = ContextVar('request_metrics', default=None)
+
+FIELDS = ('requests', 'duration', 'queries', 'db_duration',
+          'serializer_duration', 'response_bytes', 'over_budget')
+
+_lock = Lock()
+_totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+
+
+def get_query_budget(view_name):
+    budgets = getattr(settings, 'METRICS_QUERY_BUDGETS', {})
+    return budgets.get(
+        view_name, getattr(settings, 'METRICS_QUERY_BUDGET', 20)
+    )
+
+
+class RequestMetrics:
+    """Measurements of one request."""
+
+    def __init__(self):
+        self.view_name = 'unresolved'
+        self.started = time.perf_counter()
+        self.duration = 0
+        self.queries = 0
+        self.db_duration = 0
+        self.serializer_duration = 0
+        self.serializer_depth = 0
+        self.response_bytes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper, counts queries and their time."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_duration += time.perf_counter() - started
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db_duration * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer_duration * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ))
+
+
+def record(metrics, status_code):
+    over_budget = metrics.queries > get_query_budget(metrics.view_name)
+    with _lock:
+        totals = _totals[metrics.view_name, status_code]
+        totals['requests'] += 1
+        totals['duration'] += metrics.duration
+        totals['queries'] += metrics.queries
+        totals['db_duration'] += metrics.db_duration
+        totals['serializer_duration'] += metrics.serializer_duration
+        totals['response_bytes'] += metrics.response_bytes
+        totals['over_budget'] += over_budget
+    return over_budget
+
+
+def render_prometheus():
+    names = {
+        'requests': ('foodgram_requests_total', 'counter'),
+        'duration': ('foodgram_request_duration_seconds_total', 'counter'),
+        'queries': ('foodgram_db_queries_total', 'counter'),
+        'db_duration': ('foodgram_db_duration_seconds_total', 'counter'),
+        'serializer_duration': (
+            'foodgram_serializer_duration_seconds_total', 'counter'
+        ),
+        'response_bytes': ('foodgram_response_bytes_total', 'counter'),
+        'over_budget': ('foodgram_query_budget_exceeded_total', 'counter'),
+    }
+    with _lock:
+        totals = {key: dict(values) for key, values in _totals.items()}
+    lines = []
+    for field, (name, metric_type) in names.items():
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (view_name, status_code), values in sorted(totals.items()):
+            lines.append(
+                f'{name}{{view="{view_name}",status="{status_code}"}} '
+                f'{values[field]:g}'
+            )
+    lines.append('# TYPE foodgram_response_cache_total counter')
+    for key, value in sorted(cache.stats.items()):
+        view_name, _, result = key.rpartition('.')
+        lines.append(
+            f'foodgram_response_cache_total'
+            f'{{view="{view_name}",result="{result}"}} {value}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+class TimedSerializerMixin:
+    """Adds the serializer time to the metrics of the current request.
+
+    Nested timed serializers are counted once, by the outermost one.
+    """
+
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_duration += time.perf_counter() - started
+            metrics.serializer_depth -= 1
@@ -0,0 +1,107 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics, replicas
+
+logger = logging.getLogger(__name__)
+
+
+def get_view_name(view_func, method):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+class InstrumentationMiddleware:
+    """Counts queries, DB and serializer time and response size.
+
+    Removes itself from the chain unless METRICS_ENABLED is set, so a
+    disabled instance costs nothing per request.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            with self.track_queries(request_metrics):
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        if response.streaming:
+            request_metrics.stop()
+            response['Server-Timing'] = request_metrics.server_timing()
+            response.streaming_content = self.track_stream(
+                request_metrics, response, response.streaming_content
+            )
+        else:
+            request_metrics.response_bytes = len(response.content)
+            self.finish(request_metrics, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics.current.get().view_name = get_view_name(
+            view_func, request.method
+        )
+
+    @staticmethod
+    def track_queries(request_metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(request_metrics))
+        return stack
+
+    def track_stream(self, request_metrics, response, content):
+        """Streamed bodies query and grow while they are sent."""
+        with self.track_queries(request_metrics):
+            for chunk in content:
+                request_metrics.response_bytes += len(chunk)
+                yield chunk
+        self.finish(request_metrics, response, header=False)
+
+    def finish(self, request_metrics, response, header=True):
+        request_metrics.stop()
+        if header:
+            response['Server-Timing'] = request_metrics.server_timing()
+        if metrics.record(request_metrics, response.status_code):
+            logger.warning(
+                '%s: %s SQL-запросов при бюджете %s',
+                request_metrics.view_name, request_metrics.queries,
+                metrics.get_query_budget(request_metrics.view_name)
+            )
+
+
+class ReplicaMiddleware:
+    """Binds safe API requests to a read replica, see api.replicas."""
+
+    def __init__(self, get_response):
+        if not replicas.get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                replicas.pin(request)
+            return response
+        alias = None
+        if (request.path.startswith('/api/')
+                and not replicas.is_pinned(request)):
+            alias = replicas.choose_replica()
+        token = replicas.current.set(alias)
+        try:
+            return self.get_response(request)
+        finally:
+            replicas.current.reset(token)
@@ -1,5 +1,177 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class PageNumberPaginatorModified(PageNumberPagination):
+    """Page number pagination with an opt-in keyset mode.
+
+    ?cursor= switches to keyset pagination on (pub_date, id), newest
+    first, which does not slow down on deep pages. A queryset ordered
+    otherwise, by ?ordering= or by search rank, can not be walked with
+    such a cursor and gets 400. ?count=false skips the COUNT(*) query;
+    it is skipped by default in keyset mode.
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+    ordered_cursor_message = (
+        'Курсор нельзя сочетать с сортировкой или поиском, '
+        'используйте page.'
+    )
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        self.cursor_mode = self.use_cursor(request)
+        self.with_count = request.query_params.get(
+            self.count_query_param, str(not self.cursor_mode)
+        ).lower() not in ('false', '0')
+        if not self.cursor_mode and self.with_count:
+            self.page_number_mode = True
+            return super().paginate_queryset(queryset, request, view)
+        self.page_number_mode = False
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.with_count else None
+        if self.cursor_mode:
+            return self.paginate_keyset(queryset)
+        return self.paginate_offset(queryset)
+
+    def paginate_offset(self, queryset):
+        try:
+            self.page_index = int(
+                self.request.query_params.get(self.page_query_param, 1)
+            )
+        except ValueError:
+            self.page_index = 0
+        if self.page_index < 1:
+            raise NotFound(self.invalid_page_message)
+        offset = (self.page_index - 1) * self.page_size
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def decode_cursor(self, cursor):
+        try:
+            pub_date, pk = base64.urlsafe_b64decode(
+                cursor.encode()
+            ).decode().split('|')
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, pub_date, pk):
+        return base64.urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{pk}'.encode()
+        ).decode()
+
+    def paginate_keyset(self, queryset):
+        ordering = tuple(queryset.query.order_by)
+        if ordering and ordering != self.keyset_ordering:
+            raise ValidationError(
+                {self.cursor_query_param: self.ordered_cursor_message}
+            )
+        cursor = self.request.query_params.get(self.cursor_query_param)
+        queryset = queryset.order_by(*self.keyset_ordering)
+        if cursor:
+            pub_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = (
+            self.encode_cursor(rows[-1].pub_date, rows[-1].pk)
+            if self.has_next else None
+        )
+        return rows
+
+    def get_next_link(self):
+        if self.page_number_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.cursor_mode:
+            return replace_query_param(
+                url, self.cursor_query_param, self.next_cursor
+            )
+        return replace_query_param(
+            url, self.page_query_param, self.page_index + 1
+        )
+
+    def get_previous_link(self):
+        if self.page_number_mode:
+            return super().get_previous_link()
+        if self.cursor_mode or self.page_index == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_index == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_index - 1
+        )
+
+    def get_paginated_response(self, data):
+        if self.page_number_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class FeedPaginator(PageNumberPaginatorModified):
+    """Always keyset, served from the view's cached timeline if it has one.
+
+    The timeline is a list of (pub_date, id) pairs, newest first. A page
+    that runs past the end of an incomplete timeline falls back to the
+    database query.
+    """
+
+    def use_cursor(self, request):
+        return True
+
+    def paginate_keyset(self, queryset):
+        timeline = getattr(self.view, 'timeline', None)
+        if timeline is not None:
+            rows = self.paginate_timeline(queryset, timeline)
+            if rows is not None:
+                return rows
+        return super().paginate_keyset(queryset)
+
+    def paginate_timeline(self, queryset, timeline):
+        entries = timeline['entries']
+        start = 0
+        cursor = self.request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = self.decode_cursor(cursor)
+            start = next(
+                (index for index, entry in enumerate(entries)
+                 if entry < position),
+                len(entries)
+            )
+        window = entries[start:start + self.page_size + 1]
+        if len(window) <= self.page_size and not timeline['complete']:
+            return None
+        self.has_next = len(window) > self.page_size
+        window = window[:self.page_size]
+        self.next_cursor = (
+            self.encode_cursor(*window[-1]) if self.has_next else None
+        )
+        found = queryset.in_bulk([pk for _, pk in window])
+        return [found[pk] for _, pk in window if pk in found]
@@ -0,0 +1,119 @@
+"""Read replica routing.
+
+ReplicaMiddleware binds every safe API request to one healthy alias of
+DATABASE_REPLICAS and ReplicaRouter sends its reads there; everything
+else, including the rest of a request after its first write, uses the
+default database. A client whose write succeeded (2xx or 3xx) is
+pinned to the default database for DB_REPLICA_STICKY_SECONDS, so it
+reads its own writes.
+The pins are kept in the shared response cache, keyed by the
+Authorization header or, for anonymous clients, by the address nginx
+passes in X-Real-IP.
+
+A replica that fails to connect is skipped for DB_REPLICA_RETRY_SECONDS
+by the process that saw the failure.
+"""
+import hashlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('replica_alias', default=None)
+
+_retry_at = {}
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'DB_REPLICA_STICKY_SECONDS', 5)
+
+
+def get_pin_cache():
+    return caches[getattr(settings, 'DB_REPLICA_CACHE', 'responses')]
+
+
+def use_primary():
+    """Sends the remaining reads of the current request to the default."""
+    current.set(None)
+
+
+def mark_down(alias):
+    _retry_at[alias] = (
+        time.monotonic() + getattr(settings, 'DB_REPLICA_RETRY_SECONDS', 30)
+    )
+
+
+def choose_replica():
+    """A random replica that accepts connections, or None."""
+    now = time.monotonic()
+    aliases = [
+        alias for alias in get_replicas() if _retry_at.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна', alias, exc_info=True)
+            mark_down(alias)
+        else:
+            return alias
+    return None
+
+
+def pin_keys(request):
+    keys = []
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        keys.append('replica-pin:' + hashlib.sha1(
+            authorization.encode()
+        ).hexdigest())
+    address = (request.META.get('HTTP_X_REAL_IP')
+               or request.META.get('REMOTE_ADDR'))
+    keys.append(f'replica-pin:{address}')
+    return keys
+
+
+def is_pinned(request):
+    return bool(get_pin_cache().get_many(pin_keys(request)))
+
+
+def pin(request):
+    get_pin_cache().set(
+        pin_keys(request)[0], True, timeout=get_sticky_seconds()
+    )
+
+
+class ReplicaRouter:
+    """Reads of a replica-bound request go to its replica."""
+
+    def db_for_read(self, model, **hints):
+        alias = current.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        use_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
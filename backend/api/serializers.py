@@ -1,20 +1,26 @@
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from django.core.validators import MinValueValidator
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from recipes import images, shopping_cart
 from recipes.models import (CustomUser, Favorite, Follow, Ingredient,
                             IngredientInRecipe, Recipe, ShoppingList, Tag)
 
+from .fields import (BulkPrimaryKeyRelatedField, ImageSetField,
+                     StreamingBase64ImageField)
+from .metrics import TimedSerializerMixin
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -36,11 +42,59 @@ class UserSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'purchases')
 
 
-class AddFavouriteRecipeSerializer(serializers.ModelSerializer):
+class AddFavouriteRecipeSerializer(TimedSerializerMixin,
+                                   serializers.ModelSerializer):
+    image_set = ImageSetField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_set', 'cooking_time')
+
+
+class ToggleBatchSerializer(serializers.Serializer):
+    MAX_LENGTH = 500
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=MAX_LENGTH, default=list
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=MAX_LENGTH, default=list
+    )
+
+    def validate(self, data):
+        if set(data['add']) & set(data['remove']):
+            raise serializers.ValidationError(
+                'Рецепт не может быть одновременно добавлен и удален')
+        return data
+
+
+class ShoppingCartBatchSerializer(ToggleBatchSerializer):
+    MAX_SERVINGS = 100
+
+    servings = serializers.DictField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_SERVINGS),
+        default=dict
+    )
+
+    def validate_servings(self, servings):
+        try:
+            return {
+                int(recipe_id): value for recipe_id, value in servings.items()
+            }
+        except ValueError:
+            raise serializers.ValidationError(
+                'Ключами должны быть id рецептов')
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data['servings'].keys() - set(data['add']):
+            raise serializers.ValidationError({
+                'servings': 'Порции указываются только для добавляемых '
+                            'рецептов'
+            })
+        return data
 
 
 class ShoppingListRecipeSerializer(serializers.ModelSerializer):
@@ -59,6 +113,8 @@ class ListRecipeUserSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -84,24 +140,32 @@ class IngredientInRecipeSerializerToCreateRecipe(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
-class ListRecipeSerializer(serializers.ModelSerializer):
+class ListRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = ListRecipeUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_set = ImageSetField(source='image')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_set', 'text', 'cooking_time')
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_ingredients(self, obj):
-        qs = IngredientInRecipe.objects.filter(recipe=obj)
+        qs = obj.ingredientinrecipe_set.all()
         return IngredientInRecipeSerializerToCreateRecipe(qs, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -109,6 +173,8 @@ class ListRecipeSerializer(serializers.ModelSerializer):
         return Favorite.objects.filter(recipe=obj, user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -137,13 +203,15 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class ShowFollowerRecipeSerializer(serializers.ModelSerializer):
+    image_set = ImageSetField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_set', 'cooking_time')
 
 
-class ShowFollowersSerializer(serializers.ModelSerializer):
+class ShowFollowersSerializer(TimedSerializerMixin,
+                              serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField('recipes_limit_followers')
     recipes_count = serializers.SerializerMethodField('count_author_recipes')
     is_subscribed = serializers.SerializerMethodField('check_if_subscribed')
@@ -154,25 +222,29 @@ class ShowFollowersSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def recipes_limit_followers(self, user):
-        request = self.context.get('request')
-        if request.query_params.get('recipes_limit'):
-            recipes_limit = int(request.query_params.get('recipes_limit'))
-            query = Recipe.objects.filter(author=user)[:recipes_limit]
+        if hasattr(user, 'limited_recipes'):
+            query = user.limited_recipes
         else:
-            query = Recipe.objects.filter(author=user)
+            query = user.recipes.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit is not None:
+                query = query[:recipes_limit]
         serializer = ShowFollowerRecipeSerializer(
             query, read_only=True, many=True
         )
         return serializer.data
 
     def count_author_recipes(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
     def check_if_subscribed(self, user):
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
         current_user = self.context.get('current_user')
-        if user.is_anonymous:
+        if current_user is None or current_user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=current_user).exists()
+        return Follow.objects.filter(
+            user=current_user, author=user).exists()
 
 
 class ShowIngredientsSerializer(serializers.ModelSerializer):
@@ -182,7 +254,7 @@ class ShowIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount', )
 
 
-class UserSerializerModified(BaseUserSerializer):
+class UserSerializerModified(TimedSerializerMixin, BaseUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(BaseUserSerializer.Meta):
@@ -190,6 +262,8 @@ class UserSerializerModified(BaseUserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -206,10 +280,10 @@ class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = StreamingBase64ImageField(max_length=None, use_url=True)
     author = UserSerializerModified(read_only=True)
     ingredients = AddIngredientToRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
 
@@ -219,41 +293,103 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                   'name', 'image', 'text', 'cooking_time')
 
     def validate(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
+        ingredients_data = validated_data.pop('ingredients', None)
+        if ingredients_data is None:
+            return validated_data
         for ingredient in ingredients_data:
             if ingredient['amount'] <= 0:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть больше нуля!')
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients_data]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиенты не должны повторяться!'})
+        unknown_ids = set(ingredient_ids) - set(
+            Ingredient.objects.in_bulk(ingredient_ids)
+        )
+        if unknown_ids:
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не найдены: '
+                + ', '.join(map(str, sorted(unknown_ids)))
+            })
         validated_data['ingredients'] = ingredients_data
         return validated_data
 
-    def add_ingredient(self, validated_data, recipe):
-        ingredients_data = validated_data.pop('ingredients')
-        for new_ingredient in ingredients_data:
-            IngredientInRecipe.objects.get_or_create(
-                ingredient=Ingredient.objects.get(id=new_ingredient['id']),
-                recipe=recipe,
-                amount=new_ingredient['amount']
+    def set_ingredients(self, recipe, ingredients_data):
+        """Write only the changed rows, returns the previous amounts."""
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        current = {
+            row.ingredient_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount or 0
+            for ingredient_id, row in current.items()
+        }
+        removed_ids = current.keys() - new_amounts.keys()
+        if removed_ids:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed_ids
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        ])
+        return old_amounts
 
+    @transaction.atomic
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
         author = self.context.get('request').user
         recipe = Recipe.objects.create(
-            author=author, **validated_data)
-        recipe.save()
+            author=author, image_pending=True, **validated_data)
+        validated_data['image'].close()
         recipe.tags.set(tags_data)
-        validated_data['ingredients'] = ingredients_data
-        self.add_ingredient(validated_data, recipe)
+        self.set_ingredients(recipe, ingredients_data)
+        images.schedule(recipe.pk)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        IngredientInRecipe.objects.filter(recipe=recipe).delete()
-        self.add_ingredient(validated_data, recipe)
-        return super().update(recipe, validated_data)
+        ingredients_data = validated_data.pop('ingredients', None)
+        if ingredients_data is not None:
+            with shopping_cart.explicit():
+                old_amounts = self.set_ingredients(recipe, ingredients_data)
+            shopping_cart.change_recipe(recipe, old_amounts, {
+                ingredient['id']: ingredient['amount']
+                for ingredient in ingredients_data
+            })
+        if 'image' in validated_data:
+            validated_data['image_pending'] = True
+        recipe = super().update(recipe, validated_data)
+        if 'image' in validated_data:
+            validated_data['image'].close()
+            images.schedule(recipe.pk)
+        return recipe
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
         return ListRecipeSerializer(
             instance,
             context={
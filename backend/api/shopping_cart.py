@@ -0,0 +1,96 @@
+import csv
+import hashlib
+import json
+
+from django.db.models import F
+
+from recipes.models import Ingredient, ShoppingCartTotal, ShoppingList
+
+from .cache import get_user_version, get_versions
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def get_cart_etag(user, export_format):
+    """Strong ETag of the user's cart export, read from the version cache.
+
+    The user's 'cart' version changes with their totals. The versions of
+    ShoppingCartTotal, bumped by a rebuild of every cart, and of
+    Ingredient, whose name and unit are exported, are part of it too.
+    """
+    versions = get_versions((ShoppingCartTotal, Ingredient))
+    cart = get_user_version(user.pk, 'cart')
+    digest = hashlib.sha1(
+        f'{export_format}|{user.pk}|{cart}|{versions}'.encode()
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def has_cart_totals(user):
+    return ShoppingCartTotal.objects.filter(user=user, amount__gt=0).exists()
+
+
+def get_cart_totals(user):
+    return ShoppingCartTotal.objects.filter(
+        user=user, amount__gt=0
+    ).values(
+        'measurement_unit', name=F('ingredient__name'), total=F('amount')
+    ).order_by('name')
+
+
+def get_cart_summary(user):
+    return {
+        'recipes': ShoppingList.objects.filter(user=user).count(),
+        'ingredients': [
+            {
+                'name': row['name'],
+                'amount': row['total'],
+                'measurement_unit': row['measurement_unit'],
+            }
+            for row in get_cart_totals(user)
+        ],
+    }
+
+
+def stream_txt(rows):
+    for row in rows:
+        yield f'{row["name"]} - {row["total"]} {row["measurement_unit"]} \n'
+
+
+class _Echo:
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in rows:
+        yield writer.writerow(
+            (row['name'], row['total'], row['measurement_unit'])
+        )
+
+
+def stream_json(rows):
+    separator = ''
+    yield '['
+    for row in rows:
+        yield separator + json.dumps({
+            'name': row['name'],
+            'amount': row['total'],
+            'measurement_unit': row['measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+EXPORTERS = {
+    'txt': stream_txt,
+    'csv': stream_csv,
+    'json': stream_json,
+}
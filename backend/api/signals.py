@@ -0,0 +1,65 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from recipes.counters import counters_changed
+from recipes.images import image_set_rendered
+from recipes.importers import ingredients_imported
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingCartTotal, ShoppingList, Tag)
+from recipes.shopping_cart import totals_changed
+from recipes.toggles import toggled
+
+from .cache import bump_user_versions, bump_version
+from .feed import invalidate_timeline
+
+
+def invalidate_responses(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, sender))
+
+
+def invalidate_counters(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, sender, 'counters'))
+
+
+def invalidate_user_state(sender, user, **kwargs):
+    transaction.on_commit(partial(bump_user_versions, [user.pk], 'state'))
+
+
+def invalidate_user_state_of(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(bump_user_versions, [instance.user_id], 'state')
+    )
+
+
+def invalidate_carts(sender, user_ids, **kwargs):
+    if user_ids is None:
+        transaction.on_commit(partial(bump_version, sender))
+    else:
+        transaction.on_commit(partial(bump_user_versions, user_ids, 'cart'))
+
+
+def invalidate_recipe_tags(sender, **kwargs):
+    if kwargs['action'].startswith('post_'):
+        transaction.on_commit(partial(bump_version, Recipe))
+
+
+def invalidate_follower_timeline(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_timeline, instance.user_id))
+
+
+for model in (Recipe, Tag, Ingredient):
+    post_save.connect(invalidate_responses, sender=model)
+    post_delete.connect(invalidate_responses, sender=model)
+ingredients_imported.connect(invalidate_responses, sender=Ingredient)
+counters_changed.connect(invalidate_counters, sender=Recipe)
+image_set_rendered.connect(invalidate_responses, sender=Recipe)
+m2m_changed.connect(invalidate_recipe_tags, sender=Recipe.tags.through)
+for model in (Favorite, ShoppingList, Follow):
+    toggled.connect(invalidate_user_state, sender=model)
+    post_save.connect(invalidate_user_state_of, sender=model)
+    post_delete.connect(invalidate_user_state_of, sender=model)
+totals_changed.connect(invalidate_carts, sender=ShoppingCartTotal)
+post_save.connect(invalidate_follower_timeline, sender=Follow)
+post_delete.connect(invalidate_follower_timeline, sender=Follow)
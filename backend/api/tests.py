@@ -0,0 +1,1084 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, resolve
+from rest_framework.test import APIClient
+
+from recipes import images, ingredient_index, shopping_cart, toggles
+from recipes.counters import reconcile
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCartTotal, ShoppingList, Tag)
+from users.models import CustomUser
+
+from . import cache, replicas
+from . import urls as api_urls
+
+IMAGE = 'recipes/test.png'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-versions',
+    },
+    'thumbnails': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-thumbnails',
+    },
+}
+
+
+def create_recipe(author, name, tags=(), amounts=None):
+    """Recipe with the tags and {ingredient: amount}."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='.', image=IMAGE, cooking_time=10
+    )
+    recipe.tags.set(tags)
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in (amounts or {}).items()
+    ])
+    return recipe
+
+
+@override_settings(CACHES=CACHES, METRICS_ENABLED=False, DATABASE_REPLICAS=[])
+class APITestCase(TestCase):
+
+    def setUp(self):
+        # The test photo does not exist, do not hand it to the image pool.
+        images.get_cache().set(
+            images.image_set_key(IMAGE), images.PENDING, None
+        )
+
+
+class QueryCountTestCase(APITestCase):
+    """Base for tests that a response costs the same number of queries
+    whatever the size of the page."""
+
+    def assertQueriesConstant(self, client, small_url, large_url):
+        for url in (small_url, large_url):
+            self.assertEqual(client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as small:
+            client.get(small_url)
+        with self.assertNumQueries(len(small)):
+            client.get(large_url)
+
+
+class RecipeListQueriesTest(QueryCountTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='viewer@foodgram.ru', username='viewer',
+            first_name='Viewer', last_name='Viewer'
+        )
+        author = CustomUser.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Author', last_name='Author'
+        )
+        tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', Tag.ORANGE, 'breakfast'),
+                ('Обед', Tag.GREEN, 'lunch'),
+            )
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        for number in range(6):
+            create_recipe(
+                author, f'рецепт {number}', tags,
+                dict.fromkeys(ingredients, 10)
+            )
+
+    def test_anonymous_list(self):
+        self.assertQueriesConstant(
+            APIClient(), '/api/recipes/?limit=2', '/api/recipes/?limit=6'
+        )
+
+    def test_authenticated_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertQueriesConstant(
+            client, '/api/recipes/?limit=2', '/api/recipes/?limit=6'
+        )
+
+
+class UserListQueriesTest(QueryCountTestCase):
+    """djoser hides the users list from everyone but staff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(
+            email='viewer@foodgram.ru', username='viewer',
+            first_name='Viewer', last_name='Viewer', is_staff=True
+        )
+        for prefix, size in (('small', 2), ('large', 6)):
+            authors = [
+                CustomUser.objects.create(
+                    email=f'{prefix}{number}@foodgram.ru',
+                    username=f'{prefix}{number}',
+                    first_name='Author', last_name=str(number)
+                )
+                for number in range(size)
+            ]
+            Follow.objects.bulk_create([
+                Follow(user=cls.staff, author=author) for author in authors
+            ])
+        cls.author = authors[0]
+
+    def assertUsersConstant(self, client, sizes):
+        for prefix, size in zip(('small', 'large'), sizes):
+            response = client.get('/api/users/', {'search': prefix})
+            self.assertEqual(len(response.data['results']), size)
+        self.assertQueriesConstant(
+            client, '/api/users/?search=small', '/api/users/?search=large'
+        )
+
+    def test_staff_list(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        self.assertUsersConstant(client, (2, 6))
+        response = client.get('/api/users/', {'search': 'large'})
+        self.assertTrue(all(
+            user['is_subscribed'] for user in response.data['results']
+        ))
+
+    def test_hidden_list(self):
+        self.assertUsersConstant(APIClient(), (0, 0))
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.get('/api/users/')
+        self.assertEqual(
+            [user['id'] for user in response.data['results']],
+            [self.author.id]
+        )
+
+
+# name: (anonymous, [(method, url, body), ...]); the urls are formatted
+# with the ids of the generated data.
+ROUTES = {
+    'tags-list': (False, [('get', '/api/tags/', None)]),
+    'tags-detail': (False, [('get', '/api/tags/{tag}/', None)]),
+    'ingredients-list': (False, [
+        ('get', '/api/ingredients/?search={prefix}', None),
+        ('get', '/api/ingredients/?name={prefix}', None),
+    ]),
+    'ingredients-detail': (False, [
+        ('get', '/api/ingredients/{ingredient}/', None),
+    ]),
+    'recipes-list': (False, [
+        ('get', '/api/recipes/?limit={limit}', None),
+        ('get', '/api/recipes/?limit={limit}&is_favorited=1'
+                '&is_in_shopping_cart=1&tags={tag_slug}', None),
+        ('get', '/api/recipes/?limit={limit}&cursor=', None),
+    ]),
+    'recipes-list-anonymous': (True, [
+        ('get', '/api/recipes/?limit={limit}', None),
+    ]),
+    'recipes-detail': (False, [
+        ('get', '/api/recipes/{recipe}/', None),
+        ('patch', '/api/recipes/{own_recipe}/', 'own_recipe_update'),
+    ]),
+    'recipes-feed': (False, [('get', '/api/recipes/feed/', None)]),
+    'recipes-favorite-batch': (False, [
+        ('post', '/api/recipes/favorite/batch/', 'spare_add'),
+        ('post', '/api/recipes/favorite/batch/', 'spare_remove'),
+    ]),
+    'recipes-shopping-cart-batch': (False, [
+        ('post', '/api/recipes/shopping_cart/batch/', 'spare_add'),
+        ('post', '/api/recipes/shopping_cart/batch/', 'spare_remove'),
+    ]),
+    'user-recipes': (False, [('get', '/api/user/{author}/', None)]),
+    'users_subs': (False, [
+        ('get', '/api/users/subscriptions/?recipes_limit={limit}', None),
+    ]),
+    'subscribe': (False, [
+        ('post', '/api/users/{stranger}/subscribe/', None),
+        ('delete', '/api/users/{stranger}/subscribe/', None),
+    ]),
+    'add_recipe_to_favorite': (False, [
+        ('post', '/api/recipes/{spare}/favorite/', None),
+        ('delete', '/api/recipes/{spare}/favorite/', None),
+    ]),
+    'add_recipe_to_shopping_cart': (False, [
+        ('post', '/api/recipes/{spare}/shopping_cart/', None),
+        ('delete', '/api/recipes/{spare}/shopping_cart/', None),
+    ]),
+    'dowload_shopping_cart': (False, [
+        ('get', '/api/recipes/download_shopping_cart/', None),
+    ]),
+    'cache_stats': (False, [('get', '/api/cache/stats/', None)]),
+    'metrics': (False, [('get', '/api/metrics/', None)]),
+    'users-list': (False, [
+        ('get', '/api/users/?search={prefix}', None),
+    ]),
+    'users-list-anonymous': (True, [
+        ('get', '/api/users/?search={prefix}', None),
+    ]),
+    'users-detail': (False, [('get', '/api/users/{author}/', None)]),
+    'users-me': (False, [('get', '/api/users/me/', None)]),
+}
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def create_data(size, tags):
+    """Objects for one size, every relation has size rows."""
+    prefix = f'querycheck{size}'
+    viewer = CustomUser.objects.create(
+        email=f'{prefix}@foodgram.ru', username=prefix,
+        first_name='Query', last_name='Check', is_staff=True
+    )
+    authors = [
+        CustomUser.objects.create(
+            email=f'{prefix}-{number}@foodgram.ru',
+            username=f'{prefix}-{number}',
+            first_name='Author', last_name=str(number)
+        )
+        for number in range(size + 1)
+    ]
+    authors, stranger = authors[:-1], authors[-1]
+    tags = tags[:size]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'{prefix}-ингредиент-{number}', measurement_unit='г'
+        )
+        for number in range(size)
+    ]
+
+    amounts = dict.fromkeys(ingredients, 10)
+    recipes = [
+        create_recipe(author, f'{prefix}-рецепт-{number}', tags, amounts)
+        for author in authors for number in range(size)
+    ]
+    spares = [
+        create_recipe(stranger, f'{prefix}-рецепт-{number}', tags, amounts)
+        for number in range(size)
+    ]
+    own_recipe = create_recipe(viewer, f'{prefix}-рецепт-0', tags, amounts)
+    Follow.objects.bulk_create([
+        Follow(user=viewer, author=author) for author in authors
+    ])
+    Favorite.objects.bulk_create([
+        Favorite(user=viewer, recipe=recipe) for recipe in recipes
+    ])
+    ShoppingList.objects.bulk_create([
+        ShoppingList(user=viewer, recipe=recipe) for recipe in recipes
+    ])
+    reconcile()
+    shopping_cart.rebuild([viewer.id])
+    spare_ids = [recipe.id for recipe in spares]
+    return viewer, {
+        'limit': size,
+        'tag': tags[0].id,
+        'tag_slug': tags[0].slug,
+        'ingredient': ingredients[0].id,
+        'prefix': prefix,
+        'recipe': recipes[0].id,
+        'own_recipe': own_recipe.id,
+        'author': authors[0].id,
+        'stranger': stranger.id,
+        'spare': spare_ids[0],
+    }, {
+        'spare_add': {'add': spare_ids},
+        'spare_remove': {'remove': spare_ids},
+        'own_recipe_update': {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 20}
+                for ingredient in ingredients
+            ],
+            'tags': [tag.id for tag in tags],
+        },
+    }
+
+
+class RouteQueriesTest(QueryCountTestCase):
+    """Every API route costs as many queries with 2 rows in each relation
+    and on the page as with 6."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(
+                name=f'querycheck-{color}', color=color,
+                slug=f'querycheck-{color[1:]}'.lower()
+            )
+            for color, _ in Tag.COLOR_CHOICES[:6]
+        ]
+        cls.small = create_data(2, tags)
+        cls.large = create_data(6, tags)
+
+    def request_route(self, data, anonymous, requests):
+        viewer, params, bodies = data
+        client = APIClient()
+        if not anonymous:
+            client.force_authenticate(viewer)
+        for method, url, body in requests:
+            response = getattr(client, method)(
+                url.format(**params), bodies.get(body), format='json'
+            )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, url)
+
+    def test_routes(self):
+        for name, (anonymous, requests) in ROUTES.items():
+            with self.subTest(name):
+                for data in (self.small, self.large):
+                    self.request_route(data, anonymous, requests)
+                with CaptureQueriesContext(connection) as small:
+                    self.request_route(self.small, anonymous, requests)
+                with self.assertNumQueries(len(small)):
+                    self.request_route(self.large, anonymous, requests)
+
+    def test_every_route_is_checked(self):
+        checked = {
+            resolve(requests[0][1].split('?')[0].format(
+                **dict.fromkeys(('tag', 'ingredient', 'recipe', 'author',
+                                 'own_recipe', 'stranger', 'spare'), 1)
+            )).url_name
+            for _, requests in ROUTES.values()
+        }
+        self.assertEqual(
+            set(route_names(api_urls.urlpatterns)) - checked, {'api-root'}
+        )
+
+
+@override_settings(CACHES={**CACHES, 'responses': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests-responses',
+}})
+class ResponseCacheTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='viewer@foodgram.ru', username='viewer',
+            first_name='Viewer', last_name='Viewer'
+        )
+        author = CustomUser.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Author', last_name='Author'
+        )
+        cls.recipes = [
+            create_recipe(author, f'рецепт {number}') for number in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCached(self, url, hit):
+        response = APIClient().get(url)
+        self.assertEqual(response['X-Cache'], 'HIT' if hit else 'MISS')
+
+    def test_toggle_keeps_unrelated_responses(self):
+        urls = ('/api/recipes/', f'/api/recipes/{self.recipes[0].id}/')
+        popular = '/api/recipes/?ordering=-favorites_count'
+        for url in (*urls, popular):
+            self.assertCached(url, hit=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        for url in urls:
+            self.assertCached(url, hit=True)
+        self.assertCached(popular, hit=False)
+
+    def test_recipe_change_invalidates_responses(self):
+        url = '/api/recipes/'
+        self.assertCached(url, hit=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].save()
+        self.assertCached(url, hit=False)
+
+
+class ConditionalRecipeTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='viewer@foodgram.ru', username='viewer',
+            first_name='Viewer', last_name='Viewer'
+        )
+        author = CustomUser.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Author', last_name='Author'
+        )
+        cls.recipes = [
+            create_recipe(author, f'рецепт {number}') for number in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified_before_serializing(self):
+        for client, url in (
+                (self.client, '/api/recipes/'),
+                (APIClient(), '/api/recipes/'),
+                (APIClient(), f'/api/recipes/{self.recipes[0].id}/')):
+            response = client.get(url)
+            self.assertIn('Last-Modified', response)
+            with self.assertNumQueries(1):
+                not_modified = client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+            self.assertEqual(not_modified.status_code, 304)
+            not_modified = client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+            self.assertEqual(not_modified.status_code, 304)
+
+    def test_favorite_changes_only_own_validator(self):
+        own = self.client.get('/api/recipes/')
+        anonymous = APIClient().get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        self.assertEqual(self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=own['ETag']
+        ).status_code, 200)
+        self.assertEqual(APIClient().get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=anonymous['ETag']
+        ).status_code, 304)
+
+    def test_recipe_update_changes_validator(self):
+        response = APIClient().get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[1].save()
+        self.assertEqual(APIClient().get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 200)
+
+
+class CartDownloadTest(APITestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='buyer@foodgram.ru', username='buyer',
+            first_name='Buyer', last_name='Buyer'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipes = [
+            create_recipe(cls.user, f'рецепт {number}', amounts={
+                cls.ingredient: 100
+            })
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_to_cart(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def test_empty_cart(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+
+    def test_not_modified_without_queries(self):
+        self.add_to_cart(self.recipes[0])
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.URL, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_cart_and_ingredient_changes_change_etag(self):
+        self.add_to_cart(self.recipes[0])
+        etag = self.client.get(self.URL)['ETag']
+        self.add_to_cart(self.recipes[1])
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'мука пшеничная'
+            self.ingredient.save()
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('мука пшеничная', b''.join(
+            response.streaming_content
+        ).decode())
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            shopping_cart.rebuild()
+        self.assertEqual(self.client.get(
+            self.URL, HTTP_IF_NONE_MATCH=etag
+        ).status_code, 200)
+
+
+class CartTotalsTest(APITestCase):
+    """The incrementally kept cart totals match a full rebuild."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer, cls.other = [
+            CustomUser.objects.create(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name=name, last_name=name
+            )
+            for name in ('author', 'buyer', 'other')
+        ]
+        cls.flour, cls.milk, cls.eggs = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('мука', 'кг'), ('молоко', 'л'),
+                               ('яйца', 'шт'))
+        ]
+        cls.pancakes = create_recipe(cls.author, 'блины', amounts={
+            cls.flour: 1, cls.milk: 2, cls.eggs: 3
+        })
+        cls.omelette = create_recipe(cls.author, 'омлет', amounts={
+            cls.milk: 1, cls.eggs: 4
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.clients = {}
+        for user in (self.author, self.buyer, self.other):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def request(self, user, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.clients[user], method)(
+                url, data, format='json'
+            )
+
+    def totals(self):
+        return {
+            (user_id, ingredient_id, unit): amount
+            for user_id, ingredient_id, unit, amount in
+            ShoppingCartTotal.objects.filter(amount__gt=0).values_list(
+                'user_id', 'ingredient_id', 'measurement_unit', 'amount'
+            )
+        }
+
+    def assertTotalsRebuilt(self, expected):
+        totals = self.totals()
+        shopping_cart.rebuild()
+        self.assertEqual(totals, self.totals())
+        self.assertEqual(totals, {
+            (user.id, ingredient.id, unit): amount
+            for (user, ingredient, unit), amount in expected.items()
+        })
+
+    def test_cart_and_recipe_changes(self):
+        for user, recipe in ((self.buyer, self.pancakes),
+                             (self.buyer, self.omelette),
+                             (self.other, self.pancakes)):
+            response = self.request(
+                user, 'post', f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertTotalsRebuilt({
+            (self.buyer, self.flour, 'г'): 1000,
+            (self.buyer, self.milk, 'мл'): 3000,
+            (self.buyer, self.eggs, 'шт'): 7,
+            (self.other, self.flour, 'г'): 1000,
+            (self.other, self.milk, 'мл'): 2000,
+            (self.other, self.eggs, 'шт'): 3,
+        })
+
+        response = self.request(
+            self.buyer, 'delete',
+            f'/api/recipes/{self.omelette.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsRebuilt({
+            (self.buyer, self.flour, 'г'): 1000,
+            (self.buyer, self.milk, 'мл'): 2000,
+            (self.buyer, self.eggs, 'шт'): 3,
+            (self.other, self.flour, 'г'): 1000,
+            (self.other, self.milk, 'мл'): 2000,
+            (self.other, self.eggs, 'шт'): 3,
+        })
+
+        response = self.request(
+            self.author, 'patch', f'/api/recipes/{self.pancakes.id}/',
+            {'ingredients': [{'id': self.flour.id, 'amount': 2},
+                             {'id': self.eggs.id, 'amount': 3}]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTotalsRebuilt({
+            (self.buyer, self.flour, 'г'): 2000,
+            (self.buyer, self.eggs, 'шт'): 3,
+            (self.other, self.flour, 'г'): 2000,
+            (self.other, self.eggs, 'шт'): 3,
+        })
+
+        response = self.request(
+            self.author, 'delete', f'/api/recipes/{self.pancakes.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsRebuilt({})
+
+    def test_servings_and_units(self):
+        sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=self.pancakes, ingredient=sugar, amount=50
+            ),
+            IngredientInRecipe(
+                recipe=self.pancakes, ingredient=salt, amount=None
+            ),
+        ])
+        url = '/api/recipes/shopping_cart/batch/'
+        response = self.request(self.buyer, 'post', url, {
+            'add': [self.pancakes.id, self.omelette.id],
+            'servings': {self.pancakes.id: 3},
+        })
+        self.assertEqual(response.status_code, 200)
+        expected = {
+            (self.buyer, self.flour, 'г'): 3000,
+            (self.buyer, self.milk, 'мл'): 7000,
+            (self.buyer, self.eggs, 'шт'): 13,
+            (self.buyer, sugar, 'г'): 150,
+        }
+        self.assertTotalsRebuilt(expected)
+
+        response = self.request(self.buyer, 'post', url, {
+            'add': [self.pancakes.id], 'servings': {self.pancakes.id: 1},
+        })
+        self.assertEqual(response.status_code, 200)
+        expected = {
+            (self.buyer, self.flour, 'г'): 1000,
+            (self.buyer, self.milk, 'мл'): 3000,
+            (self.buyer, self.eggs, 'шт'): 7,
+            (self.buyer, sugar, 'г'): 50,
+        }
+        self.assertTotalsRebuilt(expected)
+
+        for servings in (0, None):
+            with self.subTest(servings=servings):
+                response = self.request(self.buyer, 'post', url, {
+                    'add': [self.pancakes.id],
+                    'servings': {self.pancakes.id: servings},
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertTotalsRebuilt(expected)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'нужна реплика, DB_REPLICA_HOSTS')
+@override_settings(
+    CACHES=CACHES, METRICS_ENABLED=False, DB_REPLICA_CACHE='default',
+    DB_REPLICA_STICKY_SECONDS=1,
+    DATABASE_REPLICAS=settings.DATABASE_REPLICAS[:1]
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Reads of safe requests go to the replica, a test mirror of the
+    default database, writes and reads right after them to the default."""
+
+    databases = '__all__'
+    TAGS_URL = '/api/tags/'
+
+    def setUp(self):
+        images.get_cache().set(
+            images.image_set_key(IMAGE), images.PENDING, None
+        )
+        self.replica = settings.DATABASE_REPLICAS[0]
+        user = CustomUser.objects.create(
+            email='writer@foodgram.ru', username='writer',
+            first_name='Writer', last_name='Writer'
+        )
+        self.recipe = create_recipe(user, 'рецепт')
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # Writes above leave lag marks that send reads to the default.
+        cache.get_version_cache().clear()
+        replicas.get_pin_cache().clear()
+
+    def queries(self, method, url):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default:
+            with CaptureQueriesContext(connections[self.replica]) as replica:
+                response = getattr(self.client, method)(url)
+        return response, default.captured_queries, replica.captured_queries
+
+    def assertReadsReplica(self):
+        response, default, replica = self.queries('get', self.TAGS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(default, [])
+        self.assertNotEqual(replica, [])
+
+    def assertReadsDefault(self):
+        response, default, replica = self.queries('get', self.TAGS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(default, [])
+        self.assertEqual(replica, [])
+
+    def test_reads_go_to_replica(self):
+        self.assertReadsReplica()
+
+    def test_write_pins_client_to_default(self):
+        response, default, replica = self.queries(
+            'post', f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(any(
+            query['sql'].startswith('INSERT') for query in default
+        ))
+        self.assertEqual(replica, [])
+        self.assertReadsDefault()
+        time.sleep(1.1)
+        self.assertReadsReplica()
+
+    def test_failed_write_does_not_pin(self):
+        response, _, replica = self.queries(
+            'post', f'/api/recipes/{self.recipe.id + 1}/favorite/'
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(replica, [])
+        self.assertReadsReplica()
+
+
+class RecipePaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Author', last_name='Author'
+        )
+        recipes = [
+            create_recipe(author, f'рецепт {number}') for number in range(7)
+        ]
+        # Ties on pub_date are broken by id.
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes[2:5]]
+        ).update(pub_date=recipes[2].pub_date)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_cursor_walks_every_recipe_once(self):
+        self.assertEqual(
+            self.walk('/api/recipes/?cursor=&limit=2'),
+            list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_offset_pages_keep_ordering(self):
+        self.assertEqual(
+            self.walk('/api/recipes/?ordering=name&count=false&limit=2'),
+            list(Recipe.objects.order_by('name').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_cursor_with_ordering(self):
+        response = self.client.get('/api/recipes/?cursor=&ordering=name')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+
+class ServingsUpsertTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='buyer@foodgram.ru', username='buyer',
+            first_name='Buyer', last_name='Buyer'
+        )
+        cls.in_cart, cls.new = [
+            create_recipe(cls.user, f'рецепт {number}') for number in range(2)
+        ]
+        ShoppingList.objects.create(
+            user=cls.user, recipe=cls.in_cart, servings=1
+        )
+
+    def test_returns_old_servings(self):
+        if connection.vendor == 'postgresql':
+            upsert = toggles._upsert_servings_postgresql
+        else:
+            upsert = toggles._upsert_servings_generic
+        recipe_ids = [self.in_cart.id, self.new.id]
+        self.assertEqual(upsert(self.user.id, 3, recipe_ids), {
+            self.in_cart.id: 1, self.new.id: 0
+        })
+        self.assertEqual(upsert(self.user.id, 3, recipe_ids), {})
+        self.assertEqual(upsert(self.user.id, 2, recipe_ids), {
+            self.in_cart.id: 3, self.new.id: 3
+        })
+
+
+class ToggleIdempotencyTest(APITestCase):
+    """Repeated toggles change nothing, counters do not go below zero."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            CustomUser.objects.create(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name=name, last_name=name
+            )
+            for name in ('user', 'author')
+        ]
+        cls.recipes = [
+            create_recipe(cls.author, f'рецепт {number}')
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def state(self, model, counted, field):
+        counted.refresh_from_db()
+        return model.objects.filter(user=self.user).count(), getattr(
+            counted, field
+        )
+
+    def test_single_toggles(self):
+        recipe = self.recipes[0]
+        cases = (
+            (Favorite, f'/api/recipes/{recipe.id}/favorite/',
+             recipe, 'favorites_count'),
+            (ShoppingList, f'/api/recipes/{recipe.id}/shopping_cart/',
+             recipe, 'in_carts_count'),
+            (Follow, f'/api/users/{self.author.id}/subscribe/',
+             self.author, 'followers_count'),
+        )
+        for model, url, counted, field in cases:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(self.state(model, counted, field), (1, 1))
+                # A drifted counter is clamped, not taken below zero.
+                type(counted).objects.filter(pk=counted.pk).update(
+                    **{field: 0}
+                )
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+                self.assertEqual(self.state(model, counted, field), (0, 0))
+
+    def test_favorite_batch(self):
+        url = '/api/recipes/favorite/batch/'
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        response = self.client.post(url, {'add': recipe_ids}, format='json')
+        self.assertEqual(response.data['added'], recipe_ids)
+        response = self.client.post(url, {'add': recipe_ids}, format='json')
+        self.assertEqual(response.data['added'], [])
+        for recipe in self.recipes:
+            self.assertEqual(
+                self.state(Favorite, recipe, 'favorites_count'), (2, 1)
+            )
+        for expected in (recipe_ids, []):
+            response = self.client.post(
+                url, {'remove': recipe_ids}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['removed'], expected)
+        for recipe in self.recipes:
+            self.assertEqual(
+                self.state(Favorite, recipe, 'favorites_count'), (0, 0)
+            )
+
+    def test_cart_batch(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        data = {'add': recipe_ids, 'servings': {self.recipes[0].id: 2}}
+        responses = [
+            self.client.post(url, data, format='json') for _ in range(2)
+        ]
+        self.assertEqual(responses[0].data['added'], recipe_ids)
+        self.assertEqual(responses[1].data['added'], [])
+        self.assertEqual(responses[0].data['cart'], responses[1].data['cart'])
+        self.assertEqual(dict(ShoppingList.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', 'servings')), {
+            self.recipes[0].id: 2, self.recipes[1].id: 1
+        })
+        for recipe in self.recipes:
+            self.assertEqual(
+                self.state(ShoppingList, recipe, 'in_carts_count'), (2, 1)
+            )
+        for expected in (recipe_ids, []):
+            response = self.client.post(
+                url, {'remove': recipe_ids}, format='json'
+            )
+            self.assertEqual(response.data['removed'], expected)
+        for recipe in self.recipes:
+            self.assertEqual(
+                self.state(ShoppingList, recipe, 'in_carts_count'), (0, 0)
+            )
+
+
+@override_settings(CACHES={**CACHES, 'responses': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests-responses',
+}}, FEED_TIMELINE_THRESHOLD=2)
+class FeedTimelineTest(APITestCase):
+    URL = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = [
+            CustomUser.objects.create(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name=name, last_name=name
+            )
+            for name in ('reader', 'first', 'second')
+        ]
+        cls.recipes = [
+            create_recipe(author, f'рецепт {author.username}')
+            for author in cls.authors
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def follow(self, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{author.id}/subscribe/')
+
+    def counts_follows(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return any(
+            'COUNT(' in query['sql'] and Follow._meta.db_table in query['sql']
+            for query in queries.captured_queries
+        )
+
+    def test_follows_are_counted_once(self):
+        self.follow(self.authors[0])
+        self.assertTrue(self.counts_follows())
+        self.assertFalse(self.counts_follows())
+
+        self.follow(self.authors[1])
+        self.assertTrue(self.counts_follows())
+        self.assertFalse(self.counts_follows())
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.authors[0], 'новый рецепт')
+        self.assertFalse(self.counts_follows())
+        self.assertEqual(
+            self.client.get(self.URL).data['results'][0]['name'],
+            'новый рецепт'
+        )
+
+
+class IngredientSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('ванильный сахар', 'сахарная пудра', 'сахар',
+                         'Сахар', 'соль')
+        }
+
+    def setUp(self):
+        super().setUp()
+        ingredient_index.invalidate()
+
+    def search(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.search('сах'), [
+            'Сахар', 'сахар', 'сахарная пудра', 'ванильный сахар'
+        ])
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'сах', 'limit': 3}
+        )
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            ['Сахар', 'сахар', 'сахарная пудра']
+        )
+
+    def test_order_is_stable(self):
+        first = self.search('сахар')
+        for _ in range(3):
+            ingredient_index.invalidate()
+            self.assertEqual(self.search('сахар'), first)
+        self.assertEqual(self.search('САХАР'), first)
+
+
+class IngredientImportTest(APITestCase):
+
+    def load(self, rows, extension='.json'):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix=extension, encoding='utf-8',
+                delete=False) as file:
+            if extension == '.json':
+                json.dump([
+                    {'name': name, 'measurement_unit': unit}
+                    for name, unit in rows
+                ], file, ensure_ascii=False)
+            else:
+                file.writelines(f'{name},{unit}\n' for name, unit in rows)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('load_data', path=file.name, stdout=out)
+        return out.getvalue()
+
+    def catalog(self):
+        return dict(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ))
+
+    def test_rerun_updates_without_duplicates(self):
+        rows = [('мука', 'г'), ('молоко', 'мл'), ('мука', 'кг')]
+        output = self.load(rows)
+        self.assertIn('дубликатов 1, добавлено 2, обновлено 0', output)
+        self.assertEqual(self.catalog(), {'мука': 'кг', 'молоко': 'мл'})
+
+        output = self.load(rows)
+        self.assertIn('добавлено 0, обновлено 0', output)
+        self.assertEqual(self.catalog(), {'мука': 'кг', 'молоко': 'мл'})
+
+        output = self.load([('молоко', 'л'), ('соль', 'г')], '.csv')
+        self.assertIn('добавлено 1, обновлено 1', output)
+        self.assertEqual(self.catalog(), {
+            'мука': 'кг', 'молоко': 'л', 'соль': 'г'
+        })
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (DownloadShoppingCart, FavouriteViewSet, FollowViewSet,
                     IngredientViewSet, RecipesViewSet, ShoppingListViewSet,
-                    TagViewSet, show_follows)
+                    TagViewSet, cache_stats, prometheus_metrics,
+                    show_follows)
 
 router = DefaultRouter()
 router.register('tags', TagViewSet, basename='tags')
@@ -23,5 +24,7 @@ urlpatterns = [
          ShoppingListViewSet.as_view(), name='add_recipe_to_shopping_cart'),
     path('recipes/download_shopping_cart/',
          DownloadShoppingCart.as_view(), name='dowload_shopping_cart'),
+    path('cache/stats/', cache_stats, name='cache_stats'),
+    path('metrics/', prometheus_metrics, name='metrics'),
     path('', include(router.urls))
 ]
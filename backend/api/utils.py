@@ -1,20 +1,29 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.response import Response
 
-from recipes.models import Recipe
+from recipes import toggles
+from recipes.models import Recipe, ShoppingList
 
-from .serializers import AddFavouriteRecipeSerializer
+from .serializers import (AddFavouriteRecipeSerializer,
+                          ShoppingCartBatchSerializer, ToggleBatchSerializer)
+from .shopping_cart import get_cart_summary
 
 
 def get_post(request, recipe_id, acted_model):
-    user = request.user
     recipe = get_object_or_404(Recipe, id=recipe_id)
-    if acted_model.objects.filter(user=user, recipe=recipe).exists():
+    with transaction.atomic():
+        added = toggles.add(acted_model, request.user, [recipe.id])
+    if not added:
         return Response(
             'Рецепт уже добавлен',
             status=status.HTTP_400_BAD_REQUEST)
-    acted_model.objects.create(user=user, recipe=recipe)
     serializer = AddFavouriteRecipeSerializer(recipe)
     return Response(
         serializer.data,
@@ -22,13 +31,83 @@ def get_post(request, recipe_id, acted_model):
 
 
 def get_delete(request, recipe_id, acted_model):
-    user = request.user
-    recipe = get_object_or_404(Recipe, id=recipe_id)
-    favorite_obj = get_object_or_404(acted_model, user=user, recipe=recipe)
-    if not favorite_obj:
-        return Response(
-            'Рецепт не был добавлен',
-            status=status.HTTP_400_BAD_REQUEST)
-    favorite_obj.delete()
+    with transaction.atomic():
+        removed = toggles.remove(acted_model, request.user, [recipe_id])
+    if not removed:
+        raise Http404
     return Response(
         'Удалено', status=status.HTTP_204_NO_CONTENT)
+
+
+def get_batch(request, acted_model):
+    """Apply many toggles at once, already applied ones are skipped."""
+    serializer = ToggleBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        removed = toggles.remove(
+            acted_model, request.user, serializer.validated_data['remove']
+        )
+        added = toggles.add(
+            acted_model, request.user, serializer.validated_data['add']
+        )
+    return Response({'added': sorted(added), 'removed': sorted(removed)})
+
+
+def get_cart_batch(request):
+    """Cart toggles with servings, returns the updated cart summary."""
+    serializer = ShoppingCartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    with transaction.atomic():
+        removed = toggles.remove(ShoppingList, request.user, data['remove'])
+        added = toggles.add(
+            ShoppingList, request.user,
+            set(data['add']) - data['servings'].keys()
+        )
+        added += toggles.set_servings(request.user, data['servings'])
+    return Response({
+        'added': sorted(added),
+        'removed': sorted(removed),
+        'cart': get_cart_summary(request.user),
+    })
+
+
+def get_int_param(request, name, min_value=0):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return serializers.IntegerField(min_value=min_value).run_validation(
+            value
+        )
+    except serializers.ValidationError as error:
+        raise serializers.ValidationError({name: error.detail})
+
+
+def get_authors_recipes(author_ids, recipes_limit=None):
+    """Newest recipes of every author, grouped by author id.
+
+    With a limit the recipes are ranked with ROW_NUMBER() partitioned by
+    author, so the whole page of authors is served by a single query.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).only(
+        'id', 'name', 'image', 'cooking_time', 'author_id', 'pub_date'
+    )
+    if recipes_limit is not None:
+        ranked = recipes.annotate(
+            rank_in_author=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=F('pub_date').desc()
+            )
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE rank_in_author <= %s ORDER BY pub_date DESC',
+            (*params, recipes_limit)
+        )
+    grouped = defaultdict(list)
+    for recipe in recipes:
+        grouped[recipe.author_id].append(recipe)
+    return grouped
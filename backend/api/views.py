@@ -1,55 +1,130 @@
+from functools import partial
+
 import django_filters.rest_framework
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef,
+                              Prefetch, Value)
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import filters, status, viewsets
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes, renderer_classes)
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from recipes import ingredient_index, shopping_cart, toggles
 from recipes.models import (CustomUser, Favorite, Follow, Ingredient,
                             IngredientInRecipe, Recipe, ShoppingList, Tag)
 from users.models import CustomUser
 
+from . import cache, metrics
+from .cache import CachedResponseMixin
+from .conditional import ConditionalRecipeMixin
 from .filters import IngredientFilter, RecipeFilter
-from .paginators import PageNumberPaginatorModified
+from .feed import get_timeline, invalidate_timeline
+from .paginators import FeedPaginator, PageNumberPaginatorModified
 from .permissions import AdminOrAuthorOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
 from .serializers import (CreateRecipeSerializer,
                           IngredientSerializer, ListRecipeSerializer,
                           ShowFollowersSerializer, TagSerializer)
-from .utils import get_post, get_delete
+from .shopping_cart import (CONTENT_TYPES, EXPORTERS, get_cart_etag,
+                            get_cart_totals, has_cart_totals)
+from .utils import (get_authors_recipes, get_batch, get_cart_batch,
+                    get_delete, get_int_param, get_post)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    cache_models = (Tag, )
     pagination_class = None
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(ConditionalRecipeMixin, CachedResponseMixin,
+                     viewsets.ModelViewSet):
+    cache_models = (Recipe, Tag, Ingredient)
+    cache_anonymous_only = True
+    cache_counter_fields = ('favorites_count', 'in_carts_count')
     queryset = Recipe.objects.all()
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend,
                        filters.OrderingFilter]
-    filter_class = RecipeFilter
+    filterset_class = RecipeFilter
+    ordering_fields = ('id', 'name', 'text', 'cooking_time', 'pub_date',
+                       'favorites_count', 'in_carts_count')
     pagination_class = PageNumberPaginatorModified
     permission_classes = [AdminOrAuthorOrReadOnly, ]
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'feed']:
             return ListRecipeSerializer
         return CreateRecipeSerializer
 
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            pagination_class=FeedPaginator)
+    def feed(self, request):
+        queryset = self.get_queryset().filter(author_is_subscribed=True)
+        self.timeline = get_timeline(request.user, queryset)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='favorite/batch',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return get_batch(request, Favorite)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart/batch',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return get_cart_batch(request)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({'request': self.request})
         return context
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with shopping_cart.explicit():
+            shopping_cart.change_recipe(
+                instance, shopping_cart.recipe_amounts(instance), {}
+            )
+            instance.delete()
+
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        user = self.request.user
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                author_is_subscribed=Exists(Follow.objects.filter(
+                    user=user, author=OuterRef('author'))),
+            )
+        else:
+            queryset = queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(False, output_field=BooleanField()),
+            )
         author_email = self.kwargs.get('user_id')
 
         if author_email:
@@ -58,25 +133,57 @@ class RecipesViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    cache_models = (Ingredient, )
     queryset = Ingredient.objects.all()
     permission_classes = [AllowAny, ]
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend, ]
-    filter_class = IngredientFilter
+    filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None or 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        limit = get_int_param(request, 'limit', min_value=1)
+        return Response(ingredient_index.search(name, limit))
+
+
+@api_view(['GET', ])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(dict(cache.stats))
+
+
+@api_view(['GET', ])
+@permission_classes([IsAdminUser])
+@renderer_classes([PlainTextRenderer])
+def prometheus_metrics(request):
+    return Response(metrics.render_prometheus())
+
 
 @api_view(['GET', ])
 @permission_classes([IsAuthenticated])
 def show_follows(request):
-    user_obj = CustomUser.objects.filter(following__user=request.user)
+    recipes_limit = get_int_param(request, 'recipes_limit')
+    user_obj = CustomUser.objects.filter(
+        following__user=request.user
+    ).annotate(
+        is_subscribed=Value(True, output_field=BooleanField())
+    ).order_by('id')
     paginator = PageNumberPagination()
     paginator.page_size = 6
     result_page = paginator.paginate_queryset(user_obj, request)
+    recipes = get_authors_recipes(
+        [author.id for author in result_page], recipes_limit
+    )
+    for author in result_page:
+        author.limited_recipes = recipes[author.id]
     serializer = ShowFollowersSerializer(
         result_page, many=True, context={
-            'current_user': request.user, 'request': request
+            'current_user': request.user, 'request': request,
+            'recipes_limit': recipes_limit
         })
     return paginator.get_paginated_response(serializer.data)
 
@@ -87,19 +194,21 @@ class FollowViewSet(APIView):
     def post(self, request, user_id):
         user = request.user
         author = get_object_or_404(CustomUser, id=user_id)
-        if Follow.objects.filter(user=user, author=author).exists():
-            return Response(
-                'Вы уже подписаны',
-                status=status.HTTP_400_BAD_REQUEST)
-        Follow.objects.create(user=user, author=author)
+        with transaction.atomic():
+            if not toggles.add(Follow, user, [author.id]):
+                return Response(
+                    'Вы уже подписаны',
+                    status=status.HTTP_400_BAD_REQUEST)
+            transaction.on_commit(partial(invalidate_timeline, user.id))
         serializer = ShowFollowersSerializer(author)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_id):
         user = request.user
-        author = get_object_or_404(CustomUser, id=user_id)
-        follow = get_object_or_404(Follow, user=user, author=author)
-        follow.delete()
+        with transaction.atomic():
+            if not toggles.remove(Follow, user, [user_id]):
+                raise Http404
+            transaction.on_commit(partial(invalidate_timeline, user.id))
         return Response(
             'Удалено', status=status.HTTP_204_NO_CONTENT)
 
@@ -126,40 +235,25 @@ class ShoppingListViewSet(APIView):
 
 class DownloadShoppingCart(APIView):
     permission_classes = (IsAuthenticated, )
+    renderer_classes = (PlainTextRenderer, CSVRenderer, JSONRenderer)
 
     def get(self, request):
-        recipe_ids = request.user.purchases.values_list('recipe__id',
-                                                        flat=True)
-        ingredients = IngredientInRecipe.objects.filter(recipe__in=recipe_ids)
-
-        if not ingredients.exists():
+        export_format = request.accepted_renderer.format
+        etag = get_cart_etag(request.user, export_format)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        if not has_cart_totals(request.user):
             return HttpResponse("You haven't purchased any recipes.",
                                 status=400)
 
-        buying_list = {}
-        ingredients = ingredients.values(
-            'ingredient',
-            'ingredient__name',
-            'ingredient__measurement_unit'
+        rows = get_cart_totals(request.user).iterator()
+        response = StreamingHttpResponse(
+            EXPORTERS[export_format](rows),
+            content_type=CONTENT_TYPES[export_format]
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename="wishlist.{export_format}"'
         )
-        ingredients = ingredients.annotate(sum_amount=Sum('amount'))
-
-        for ingredient in ingredients:
-            sum_amount = ingredient.get('sum_amount')
-            name = ingredient.get('ingredient__name')
-            measurement_unit = ingredient.get('ingredient__measurement_unit')
-
-            if sum_amount > 0 and name not in buying_list:
-                buying_list[name] = {
-                    'measurement_unit': measurement_unit,
-                    'sum_amount': sum_amount
-                }
-
-        wishlist = []
-        for item in buying_list:
-            wishlist.append(f'{item} - {buying_list[item]["sum_amount"]} '
-                            f'{buying_list[item]["measurement_unit"]} \n')
-
-        response = HttpResponse(wishlist, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="wishlist.txt"'
         return response
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -32,6 +33,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,10 +71,45 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default=None),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=None),
         'HOST': os.getenv('DB_HOST', default=None),
-        'PORT': os.getenv('DB_PORT', default=None)
+        'PORT': os.getenv('DB_PORT', default=None),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+# Persistent connections idle for DB_CONN_HEALTH_CHECK_IDLE seconds are
+# checked with a query at the start of a request and reopened if the
+# server dropped them.
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='True'
+) == 'True'
+DB_CONN_HEALTH_CHECK_IDLE = int(
+    os.getenv('DB_CONN_HEALTH_CHECK_IDLE', default=10)
+)
+# Connections the server (or pgbouncer) accepts from this application,
+# compared with GUNICORN_WORKERS x GUNICORN_THREADS by a system check.
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', default=0)) or None
+
+# Read replicas, host or host:port separated by commas.
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv(
+        'DB_REPLICA_HOSTS', default='').split(','))):
+    host, _, port = address.strip().partition(':')
+    DATABASE_REPLICAS.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+DB_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DB_REPLICA_STICKY_SECONDS', default=5)
+)
+DB_REPLICA_RETRY_SECONDS = int(
+    os.getenv('DB_REPLICA_RETRY_SECONDS', default=30)
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.'
@@ -136,9 +174,65 @@ ADMIN_EMAIL = 'admin@foodgram.ru'
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default='/var/tmp/foodgram_cache'
+        ),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('RESPONSE_CACHE_MAX_ENTRIES', default=10000)
+            ),
+        },
+    },
+    # Response cache version tokens, few keys that must not be culled
+    # together with the response bodies.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION', default='/var/tmp/foodgram_versions'
+        ),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+    'thumbnails': {
+        'BACKEND': os.getenv(
+            'THUMBNAIL_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'THUMBNAIL_CACHE_LOCATION', default='/var/tmp/foodgram_thumbnails'
+        ),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('THUMBNAIL_CACHE_MAX_ENTRIES', default=100000)
+            ),
+        },
+    },
+}
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='') == 'True'
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', default=20))
+METRICS_QUERY_BUDGETS = {
+    'RecipesViewSet.list': 12,
+    'RecipesViewSet.retrieve': 8,
+    'show_follows': 8,
 }
 
+THUMBNAIL_KVSTORE = 'sorl.thumbnail.kvstores.cached_db_kvstore.KVStore'
+THUMBNAIL_CACHE = 'thumbnails'
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 
@@ -1,20 +1,14 @@
 from django.contrib import admin
-from django.db.models import Count
 
-from .models import Favorite, Follow, Ingredient, Recipe, ShoppingList, Tag
+from .models import (Favorite, Follow, Ingredient, Recipe, ShoppingCartTotal,
+                     ShoppingList, Tag)
+from .shopping_cart import totals_changed
 
 
 class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags')
-    list_display = ('name', 'author', 'get_favorite_count')
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(favorite_count=Count('favorite_recipe'))
-
-    @staticmethod
-    def get_favorite_count(obj):
-        return obj.favorite_count
+    list_display = ('name', 'author', 'favorites_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -22,9 +16,27 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
 
 
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    """Reports edits of the totals like the incremental updates do."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        totals_changed.send(sender=ShoppingCartTotal, user_ids=[obj.user_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        totals_changed.send(sender=ShoppingCartTotal, user_ids=[obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        totals_changed.send(sender=ShoppingCartTotal, user_ids=user_ids)
+
+
 admin.site.register(Follow)
 admin.site.register(Tag)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Favorite)
 admin.site.register(ShoppingList)
+admin.site.register(ShoppingCartTotal, ShoppingCartTotalAdmin)
@@ -0,0 +1,54 @@
+"""Denormalized popularity counters on Recipe and CustomUser."""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+
+from users.models import CustomUser
+
+from .models import Favorite, Follow, Recipe, ShoppingList
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+)
+
+
+# Sent with the counted model as sender whenever counters are updated,
+# the updates bypass the model signals.
+counters_changed = Signal()
+
+COUNTED = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingList: (Recipe, 'recipe_id', 'in_carts_count'),
+    Recipe: (CustomUser, 'author_id', 'recipes_count'),
+    Follow: (CustomUser, 'author_id', 'followers_count'),
+}
+
+
+def change(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, Value(0))}
+    )
+    counters_changed.send(sender=model)
+
+
+def reconcile():
+    """Recount every counter, returns the number of rows fixed."""
+    fixed = 0
+    for model, field, source, source_field in COUNTERS:
+        actual = Coalesce(Subquery(
+            source.objects.filter(
+                **{source_field: OuterRef('pk')}
+            ).order_by().values(source_field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), Value(0))
+        updated = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).update(**{field: actual})
+        if updated:
+            counters_changed.send(sender=model)
+        fixed += updated
+    return fixed
@@ -0,0 +1,172 @@
+"""Background processing of uploaded recipe photos.
+
+After the recipe is committed the photo is handed to a thread pool of
+IMAGE_WORKERS threads per process. The worker applies the EXIF
+orientation, saves a copy without the metadata under a new name and
+pre-renders sorl.thumbnail renditions at RENDITION_WIDTHS in JPEG and
+WebP, so the request returns as soon as the file is stored. The
+original is deleted only after the recipe points at the copy. The
+rendition URLs are then stored as one entry in the THUMBNAIL_CACHE
+cache, which is what list responses read; they never render thumbnails
+themselves. Every finished set sends image_set_rendered, so the cached
+responses that still say null are replaced.
+
+Recipe.image_pending stays set until the worker is done, so photos whose
+job was lost with the process are picked up by warm_thumbnails.
+
+Memory: uploads are limited to IMAGE_MAX_PIXELS (25 Mpx by default) at
+validation time, so one worker holds at most about two decoded copies
+of the image, 4 bytes per pixel each (about 200 MB at the default
+limit). Peak per process is that times IMAGE_WORKERS.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = ('JPEG', 'WEBP')
+RENDITION_QUALITY = 82
+PENDING = ()
+PENDING_TIMEOUT = 60
+
+# Sent with Recipe as sender when the renditions of a photo are cached.
+image_set_rendered = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+    thread_name_prefix='recipe-images'
+)
+
+
+def rendition_options(width, file_format):
+    return str(width), {
+        'format': file_format, 'quality': RENDITION_QUALITY,
+        'upscale': False
+    }
+
+
+def strip_metadata(image_field):
+    """Saves the photo without its metadata, returns the new name.
+
+    None when the photo has no metadata to strip.
+    """
+    with image_field.open('rb') as file:
+        image = Image.open(file)
+        if not image.getexif():
+            return None
+        file_format = image.format
+        image = ImageOps.exif_transpose(image)
+    output = io.BytesIO()
+    if file_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(output, format=file_format, quality=95)
+    image.close()
+    return image_field.storage.save(
+        image_field.name, ContentFile(output.getvalue())
+    )
+
+
+def image_set_key(name):
+    return 'image_set:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def get_cache():
+    return caches[getattr(settings, 'THUMBNAIL_CACHE', 'default')]
+
+
+def render(image_field):
+    image_set = []
+    for width in RENDITION_WIDTHS:
+        rendition = {'width': width}
+        for file_format in RENDITION_FORMATS:
+            geometry, options = rendition_options(width, file_format)
+            thumbnail = get_thumbnail(image_field, geometry, **options)
+            rendition['height'] = thumbnail.height
+            rendition[file_format.lower()] = thumbnail.url
+        image_set.append(rendition)
+    get_cache().set(image_set_key(image_field.name), image_set, None)
+    image_set_rendered.send(sender=Recipe)
+    return image_set
+
+
+def get_image_set(image_field):
+    """Cached renditions of the photo or None if they are not ready.
+
+    A miss is remembered for PENDING_TIMEOUT seconds and, once per that
+    period, hands the photo to the thread pool. When sorl still knows
+    the source (the key-value store is backed by the database) the set
+    is rebuilt there from the stored thumbnails; otherwise the photo is
+    still being processed. The response itself never renders nor
+    queries anything.
+    """
+    if not image_field:
+        return None
+    cache = get_cache()
+    key = image_set_key(image_field.name)
+    image_set = cache.get(key)
+    if image_set is None and cache.add(key, PENDING, PENDING_TIMEOUT):
+        executor.submit(restore_image_set, image_field.name)
+    return image_set or None
+
+
+def restore_image_set(image_name):
+    try:
+        image_field = Recipe(image=image_name).image
+        if default.kvstore.get(ImageFile(image_field)):
+            render(image_field)
+    except Exception:
+        logger.exception('Не удалось восстановить миниатюры %s', image_name)
+    finally:
+        close_old_connections()
+
+
+def process(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    storage = recipe.image.storage
+    original = recipe.image.name
+    stripped = strip_metadata(recipe.image)
+    if stripped is not None:
+        if not Recipe.objects.filter(
+                pk=recipe_id, image=original).update(image=stripped):
+            # The photo was replaced meanwhile and has its own job.
+            storage.delete(stripped)
+            return
+        recipe.image.name = stripped
+    render(recipe.image)
+    Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+        image_pending=False
+    )
+    if stripped is not None:
+        storage.delete(original)
+
+
+def process_recipe_image(recipe_id):
+    try:
+        process(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(recipe_id):
+    transaction.on_commit(
+        partial(executor.submit, process_recipe_image, recipe_id)
+    )
@@ -0,0 +1,116 @@
+"""Streaming bulk import of the ingredient catalog."""
+import csv
+import json
+import os
+
+from django.db import connection
+from django.dispatch import Signal
+
+from .models import Ingredient
+
+# Sent after a bulk import, which bypasses the model signals; receivers
+# run inside the caller's transaction.
+ingredients_imported = Signal()
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_json(path):
+    """Yield (name, unit) from a JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = ''
+        position = 0
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n[,]':
+                position += 1
+            if position == len(buffer) and eof:
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = file.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item['name'], item['measurement_unit']
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_rows(path):
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return read_csv(path)
+    return read_json(path)
+
+
+def batches(rows, batch_size, stats):
+    """Group rows into {name: unit} batches, the last duplicate wins."""
+    batch = {}
+    for name, unit in rows:
+        name, unit = name.strip(), unit.strip()
+        stats['read'] += 1
+        if name in batch:
+            stats['duplicates'] += 1
+        batch[name] = unit
+        if len(batch) >= batch_size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+def upsert_postgresql(batch, stats):
+    from psycopg2.extras import execute_values
+
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        inserted = execute_values(
+            cursor.cursor,
+            f'INSERT INTO {table} (name, measurement_unit) VALUES %s '
+            f'ON CONFLICT (name) DO UPDATE '
+            f'SET measurement_unit = EXCLUDED.measurement_unit '
+            f'WHERE {table}.measurement_unit '
+            f'<> EXCLUDED.measurement_unit '
+            f'RETURNING (xmax = 0)',
+            list(batch.items()), page_size=len(batch), fetch=True
+        )
+    created = sum(1 for (is_new, ) in inserted if is_new)
+    stats['created'] += created
+    stats['updated'] += len(inserted) - created
+
+
+def upsert_generic(batch, stats):
+    existing = Ingredient.objects.in_bulk(list(batch), field_name='name')
+    changed = []
+    for name, ingredient in existing.items():
+        if ingredient.measurement_unit != batch[name]:
+            ingredient.measurement_unit = batch[name]
+            changed.append(ingredient)
+    Ingredient.objects.bulk_update(changed, ['measurement_unit'])
+    Ingredient.objects.bulk_create([
+        Ingredient(name=name, measurement_unit=unit)
+        for name, unit in batch.items() if name not in existing
+    ])
+    stats['created'] += len(batch) - len(existing)
+    stats['updated'] += len(changed)
+
+
+def import_ingredients(path, batch_size, stats):
+    """Upsert ingredients from path; the caller owns the transaction."""
+    if connection.vendor == 'postgresql':
+        upsert = upsert_postgresql
+    else:
+        upsert = upsert_generic
+    for batch in batches(read_rows(path), batch_size, stats):
+        upsert(batch, stats)
+    ingredients_imported.send(sender=Ingredient)
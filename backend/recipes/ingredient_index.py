@@ -0,0 +1,74 @@
+"""Per-process in-memory index for ingredient autocomplete.
+
+The ingredient catalog is small and read on every keystroke of the
+recipe form, so it is loaded once into a sorted array and searched with
+bisect. Signals in recipes.signals drop the index of the current process
+on every write; other processes rebuild theirs after
+INGREDIENT_INDEX_TTL seconds.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+_lock = threading.Lock()
+_index = None
+
+
+class IngredientIndex:
+
+    def __init__(self, ingredients):
+        # Names equal up to case are ordered by name, then by id.
+        ingredients = sorted(
+            ingredients, key=lambda row: (row[1].casefold(), row[1], row[0])
+        )
+        rows = [
+            (name.casefold(), {
+                'id': pk, 'name': name, 'measurement_unit': unit
+            })
+            for pk, name, unit in ingredients
+        ]
+        self.keys = [key for key, _ in rows]
+        self.rows = [row for _, row in rows]
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit=None):
+        """Prefix matches first, then substring matches, both by name."""
+        key = query.casefold()
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key + '\U0010ffff', lo=start)
+        found = self.rows[start:end]
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+        if key:
+            found = found + [
+                row for name, row in zip(self.keys, self.rows)
+                if key in name and not name.startswith(key)
+            ]
+        return found if limit is None else found[:limit]
+
+
+def get_index():
+    global _index
+    index = _index
+    ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+    if index is None or time.monotonic() - index.built_at > ttl:
+        with _lock:
+            if _index is None or _index is index:
+                _index = IngredientIndex(Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ))
+            index = _index
+    return index
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def search(query, limit=None):
+    return get_index().search(query, limit)
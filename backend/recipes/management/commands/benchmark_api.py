@@ -0,0 +1,213 @@
+import json
+import random
+import resource
+import statistics
+import subprocess
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.metrics import RequestMetrics
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingList)
+from users.models import CustomUser
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число SQL-запросов и память основных '
+            'эндпоинтов API, результат сохраняется в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--conn-max-age', type=int,
+            help='CONN_MAX_AGE на время замера; соединения закрываются и '
+                 'переиспользуются между запросами так же, как в WSGI'
+        )
+
+    def get_user(self):
+        user = CustomUser.objects.filter(
+            email__startswith='fixture'
+        ).order_by('-followers_count').first()
+        if user is None:
+            user = CustomUser.objects.order_by('id').first()
+        return user
+
+    def get_scenarios(self, user):
+        recipe_ids = list(
+            Recipe.objects.values_list('id', flat=True)[:1000]
+        )
+        author_ids = list(CustomUser.objects.exclude(
+            pk=user.pk
+        ).values_list('id', flat=True)[:1000])
+        prefixes = [
+            name[:random.randint(1, 3)] for name in
+            Ingredient.objects.values_list('name', flat=True)[:1000]
+        ] or ['а']
+
+        def toggle(path, ids, existing):
+            """POST then DELETE of a target the user has not acted on.
+
+            The fixture rows of the user are never among the targets and
+            nothing is deleted after a failed POST, so the data is left
+            as it was.
+            """
+            ids = sorted(set(ids) - set(existing)) or [0]
+
+            def run(client):
+                url = path.format(random.choice(ids))
+                response = client.post(url)
+                if response.status_code != 201:
+                    return response
+                return client.delete(url)
+            return run
+
+        return {
+            'recipes.list': lambda client: client.get(
+                '/api/recipes/', {'page': random.randint(1, 5), 'limit': 6}
+            ),
+            'recipes.list.anonymous': lambda client: APIClient().get(
+                '/api/recipes/', {'page': random.randint(1, 5), 'limit': 6}
+            ),
+            'recipes.retrieve': lambda client: client.get(
+                f'/api/recipes/{random.choice(recipe_ids)}/'
+            ),
+            'recipes.feed': lambda client: client.get('/api/recipes/feed/'),
+            'show_follows': lambda client: client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 3}
+            ),
+            'download_shopping_cart': lambda client: client.get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'ingredients.search': lambda client: client.get(
+                '/api/ingredients/', {'name': random.choice(prefixes)}
+            ),
+            'favorite.toggle': toggle(
+                '/api/recipes/{}/favorite/', recipe_ids,
+                Favorite.objects.filter(user=user).values_list(
+                    'recipe_id', flat=True
+                )
+            ),
+            'shopping_cart.toggle': toggle(
+                '/api/recipes/{}/shopping_cart/', recipe_ids,
+                ShoppingList.objects.filter(user=user).values_list(
+                    'recipe_id', flat=True
+                )
+            ),
+            'subscribe.toggle': toggle(
+                '/api/users/{}/subscribe/', author_ids,
+                Follow.objects.filter(user=user).values_list(
+                    'author_id', flat=True
+                )
+            ),
+        }
+
+    def wsgi_request(self, run):
+        """Opens and closes connections around the request like WSGI.
+
+        The test client disconnects close_old_connections from the
+        request signals, so without this every scenario reuses one
+        connection whatever CONN_MAX_AGE is.
+        """
+        def request(client):
+            close_old_connections()
+            try:
+                return run(client)
+            finally:
+                close_old_connections()
+        return request
+
+    def measure(self, run, client, count, warmup):
+        if self.conn_max_age is not None:
+            run = self.wsgi_request(run)
+        for _ in range(warmup):
+            run(client)
+        durations = []
+        queries = []
+        statuses = Counter()
+        for _ in range(count):
+            metrics = RequestMetrics()
+            with ExitStack() as stack:
+                # Replica reads run on their own connections.
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics)
+                    )
+                started = time.perf_counter()
+                response = run(client)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                durations.append(time.perf_counter() - started)
+            queries.append(metrics.queries)
+            statuses[response.status_code] += 1
+        quantiles = statistics.quantiles(durations, n=100)
+        return {
+            'requests': count,
+            'p50_ms': round(quantiles[49] * 1000, 2),
+            'p95_ms': round(quantiles[94] * 1000, 2),
+            'mean_ms': round(statistics.mean(durations) * 1000, 2),
+            'queries_per_request': round(statistics.mean(queries), 2),
+            'max_queries': max(queries),
+            'statuses': {str(code): n for code, n in statuses.items()},
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        user = self.get_user()
+        if user is None:
+            self.stderr.write('Нет пользователей, выполните generate_fixtures')
+            return
+        token, _ = Token.objects.get_or_create(user=user)
+        self.conn_max_age = options['conn_max_age']
+        if self.conn_max_age is not None:
+            for alias in connections:
+                connections[alias].close()
+                connections[alias].settings_dict['CONN_MAX_AGE'] = (
+                    self.conn_max_age
+                )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, run in self.get_scenarios(user).items():
+            results[name] = self.measure(
+                run, client, options['requests'], options['warmup']
+            )
+            self.stdout.write(
+                f'{name:28} p50 {results[name]["p50_ms"]:8.2f} мс  '
+                f'p95 {results[name]["p95_ms"]:8.2f} мс  '
+                f'запросов {results[name]["queries_per_request"]:6.2f}'
+            )
+        report = {
+            'commit': get_commit(),
+            'database': connection.vendor,
+            'conn_max_age': self.conn_max_age,
+            'recipes': Recipe.objects.count(),
+            'users': CustomUser.objects.count(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'
+        ))
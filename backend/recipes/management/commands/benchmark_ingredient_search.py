@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов в памяти с запросом к базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('Нет ингредиентов, сначала выполните load_data')
+            return
+        random.seed(0)
+        prefixes = [
+            name[:random.randint(1, 4)]
+            for name in random.choices(names, k=options['queries'])
+        ]
+        limit = options['limit']
+
+        start = time.perf_counter()
+        for prefix in prefixes:
+            queryset = Ingredient.objects.filter(
+                name__startswith=prefix
+            ).values('id', 'name', 'measurement_unit')
+            list(queryset[:limit] if limit else queryset)
+        orm = time.perf_counter() - start
+
+        ingredient_index.invalidate()
+        start = time.perf_counter()
+        ingredient_index.get_index()
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        for prefix in prefixes:
+            ingredient_index.search(prefix, limit)
+        memory = time.perf_counter() - start
+
+        count = len(prefixes)
+        self.stdout.write(
+            f'Запросов: {count}, ингредиентов: {len(names)}\n'
+            f'ORM:      {orm / count * 1e6:10.1f} мкс/запрос\n'
+            f'Индекс:   {memory / count * 1e6:10.1f} мкс/запрос '
+            f'(построение {build * 1e3:.1f} мс)'
+        )
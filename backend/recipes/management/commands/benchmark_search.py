@@ -0,0 +1,100 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.filters import IngredientFilter, RecipeFilter
+from recipes import counters
+from recipes.models import Ingredient, Recipe
+from users.models import CustomUser
+
+DISHES = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет')
+
+
+class Command(BaseCommand):
+    help = ('Генерирует рецепты и замеряет поиск по рецептам и '
+            'ингредиентам. Сгенерированные рецепты удаляются откатом '
+            'транзакции, если не указан --keep')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true',
+                            help='сохранить сгенерированные рецепты')
+
+    def generate(self, total, batch_size):
+        words = list(Ingredient.objects.values_list('name', flat=True))
+        if not words:
+            words = list(DISHES)
+        author, _ = CustomUser.objects.get_or_create(
+            email='benchmark@foodgram.ru',
+            defaults={'username': 'benchmark', 'first_name': 'Bench',
+                      'last_name': 'Mark'}
+        )
+        missing = total - Recipe.objects.count()
+        created = max(missing, 0)
+        while missing > 0:
+            size = min(batch_size, missing)
+            Recipe.objects.bulk_create([
+                Recipe(
+                    author=author,
+                    name=(f'{random.choice(DISHES)} '
+                          f'{random.choice(words)}')[:200],
+                    text=' '.join(random.choices(words, k=20)),
+                    image='recipes/benchmark.png',
+                    cooking_time=random.randint(5, 180)
+                )
+                for _ in range(size)
+            ])
+            missing -= size
+            self.stdout.write(f'Осталось создать: {missing}')
+        counters.change(CustomUser, [author.pk], 'recipes_count', created)
+        return words
+
+    def measure(self, filterset_class, queryset, terms):
+        start = time.perf_counter()
+        for term in terms:
+            list(filterset_class(
+                {'search': term}, queryset=queryset
+            ).qs[:10])
+        return (time.perf_counter() - start) / len(terms) * 1000
+
+    def explain(self, filterset_class, queryset, term):
+        """Plan of one search, to check that the indexes are used."""
+        self.stdout.write(filterset_class(
+            {'search': term}, queryset=queryset
+        ).qs[:10].explain(analyze=True))
+
+    def benchmark(self, options):
+        random.seed(0)
+        words = self.generate(options['recipes'], options['batch_size'])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'ANALYZE {Recipe._meta.db_table}, '
+                    f'{Ingredient._meta.db_table}'
+                )
+        terms = [
+            random.choice(words).split()[0]
+            for _ in range(options['queries'])
+        ]
+        recipe_ms = self.measure(RecipeFilter, Recipe.objects.all(), terms)
+        ingredient_ms = self.measure(
+            IngredientFilter, Ingredient.objects.all(), terms
+        )
+        if connection.vendor == 'postgresql':
+            self.explain(RecipeFilter, Recipe.objects.all(), terms[0])
+            self.explain(IngredientFilter, Ingredient.objects.all(), terms[0])
+        self.stdout.write(
+            f'База: {connection.vendor}, '
+            f'рецептов: {Recipe.objects.count()}\n'
+            f'Поиск рецептов:     {recipe_ms:8.2f} мс/запрос\n'
+            f'Поиск ингредиентов: {ingredient_ms:8.2f} мс/запрос'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options)
+            transaction.set_rollback(not options['keep'])
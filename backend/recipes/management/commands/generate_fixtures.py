@@ -0,0 +1,192 @@
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import counters, shopping_cart
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingList, Tag)
+from users.models import CustomUser
+
+DISHES = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет')
+EMAIL = 'fixture{}@foodgram.ru'
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ranks 1..count, rank 1 is the most popular."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def sample(population, cum_weights, count):
+    """Up to count distinct items drawn with the given popularity."""
+    if not population:
+        return set()
+    return set(random.choices(
+        population, cum_weights=cum_weights, k=count
+    ))
+
+
+class Command(BaseCommand):
+    help = ('Создает синтетических пользователей, рецепты, подписки, '
+            'избранное и списки покупок с популярностью по закону Ципфа')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='подписок на пользователя')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='рецептов в списке покупок пользователя')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='показатель распределения популярности')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def bulk_create(self, model, rows, batch_size):
+        rows = iter(rows)
+        created = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {created}')
+
+    def create_users(self, count, batch_size):
+        start = CustomUser.objects.filter(
+            email__startswith='fixture'
+        ).count()
+        password = make_password(None)
+        self.bulk_create(CustomUser, (
+            CustomUser(
+                email=EMAIL.format(number), username=f'fixture{number}',
+                first_name='Fixture', last_name=str(number),
+                password=password
+            )
+            for number in range(start, start + count)
+        ), batch_size)
+        return list(CustomUser.objects.filter(
+            email__startswith='fixture'
+        ).values_list('id', flat=True))
+
+    def get_ingredients(self):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            Ingredient.objects.bulk_create([
+                Ingredient(name=f'ингредиент {number}',
+                           measurement_unit=random.choice(('г', 'мл', 'шт.')))
+                for number in range(500)
+            ])
+            ingredient_ids = list(
+                Ingredient.objects.values_list('id', flat=True)
+            )
+        return ingredient_ids
+
+    def get_tags(self):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not tag_ids:
+            Tag.objects.bulk_create([
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in (
+                    ('Завтрак', Tag.ORANGE, 'breakfast'),
+                    ('Обед', Tag.GREEN, 'lunch'),
+                    ('Ужин', Tag.PURPLE, 'dinner'),
+                )
+            ])
+            tag_ids = list(Tag.objects.values_list('id', flat=True))
+        return tag_ids
+
+    def create_recipes(self, count, author_ids, author_weights, batch_size):
+        ingredient_names = list(
+            Ingredient.objects.values_list('name', flat=True)[:1000]
+        )
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=random.choices(
+                    author_ids, cum_weights=author_weights
+                )[0],
+                name=(f'{random.choice(DISHES)} '
+                      f'{random.choice(ingredient_names)}')[:200],
+                text=' '.join(random.choices(ingredient_names, k=20)),
+                image='recipes/benchmark.png',
+                cooking_time=random.randint(5, 180)
+            )
+            for _ in range(count)
+        ), batch_size)
+        return list(Recipe.objects.filter(
+            author_id__in=author_ids
+        ).order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        batch_size = options['batch_size']
+        exponent = options['zipf']
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'], batch_size)
+            authors = random.sample(user_ids, len(user_ids))
+            author_weights = zipf_weights(len(authors), exponent)
+            ingredient_ids = self.get_ingredients()
+            ingredient_weights = zipf_weights(len(ingredient_ids), exponent)
+            tag_ids = self.get_tags()
+            recipe_ids = self.create_recipes(
+                options['recipes'], authors, author_weights, batch_size
+            )
+            new_recipe_ids = recipe_ids[-options['recipes']:]
+            self.bulk_create(Recipe.tags.through, (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in new_recipe_ids
+                for tag_id in random.sample(
+                    tag_ids, random.randint(1, len(tag_ids))
+                )
+            ), batch_size)
+            self.bulk_create(IngredientInRecipe, (
+                IngredientInRecipe(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=random.randint(1, 500)
+                )
+                for recipe_id in new_recipe_ids
+                for ingredient_id in sample(
+                    ingredient_ids, ingredient_weights,
+                    options['ingredients_per_recipe']
+                )
+            ), batch_size)
+            popular = random.sample(recipe_ids, len(recipe_ids))
+            recipe_weights = zipf_weights(len(popular), exponent)
+            self.bulk_create(Follow, (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in sample(
+                    authors, author_weights, options['follows']
+                ) if author_id != user_id
+            ), batch_size)
+            self.bulk_create(Favorite, (
+                Favorite(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in sample(
+                    popular, recipe_weights, options['favorites']
+                )
+            ), batch_size)
+            self.bulk_create(ShoppingList, (
+                ShoppingList(
+                    user_id=user_id, recipe_id=recipe_id,
+                    servings=random.choice((1, 1, 1, 2, 4))
+                )
+                for user_id in user_ids
+                for recipe_id in sample(
+                    popular, recipe_weights, options['cart']
+                )
+            ), batch_size)
+            fixed = counters.reconcile()
+            totals = shopping_cart.rebuild(user_ids, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: счетчиков пересчитано {fixed}, '
+            f'итогов списков покупок {totals}'
+        ))
@@ -1,29 +1,38 @@
-import json
+from collections import Counter
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from recipes.models import Ingredient
+from recipes import ingredient_index
+from recipes.importers import import_ingredients
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        with open('ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for i in data:
-                ingredient_name = i['name']
-                measurement_unit = i['measurement_unit']
+    help = 'Загружает ингредиенты из JSON или CSV файла'
 
-                existing_ingredient = Ingredient.objects.filter(
-                    name=ingredient_name
-                ).first()
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='ingredients.json')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить импорт и откатить транзакцию'
+        )
 
-                if existing_ingredient:
-                    existing_ingredient.measurement_unit = measurement_unit
-                    existing_ingredient.save()
-                    print(f"Updated: {ingredient_name} - {measurement_unit}")
-                else:
-                    ingredient = Ingredient(
-                        name=ingredient_name, measurement_unit=measurement_unit
-                    )
-                    ingredient.save()
-                    print(f"Inserted: {ingredient_name} - {measurement_unit}")
+    def handle(self, *args, **options):
+        stats = Counter()
+        try:
+            with transaction.atomic():
+                import_ingredients(
+                    options['path'], options['batch_size'], stats
+                )
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except OSError as error:
+            raise CommandError(error)
+        if not options['dry_run']:
+            ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Проверено' if options['dry_run'] else 'Загружено'}: "
+            f"прочитано {stats['read']}, дубликатов {stats['duplicates']}, "
+            f"добавлено {stats['created']}, обновлено {stats['updated']}"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_cart import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги списков покупок из ShoppingList'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя, можно указать несколько раз'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild(options['user_ids'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано итогов: {written}'
+        ))
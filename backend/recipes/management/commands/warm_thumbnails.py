@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes import images
+from recipes.models import Recipe
+
+
+def warm(recipe_id, image_name, pending, force):
+    try:
+        if pending:
+            images.process(recipe_id)
+            return True
+        image_field = Recipe(pk=recipe_id, image=image_name).image
+        if not force and images.get_cache().get(
+                images.image_set_key(image_name)) is not None:
+            return False
+        images.render(image_field)
+        return True
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает фото, оставшиеся без обработки, и заранее '
+            'готовит миниатюры для существующих рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='пересобрать набор миниатюр, даже если он уже в кэше'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'id', 'image', 'image_pending'
+        ).iterator()
+        rendered = skipped = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(
+                    warm, recipe_id, image, pending, options['force']
+                ): recipe_id
+                for recipe_id, image, pending in recipes
+            }
+            for future in as_completed(futures):
+                try:
+                    if future.result():
+                        rendered += 1
+                    else:
+                        skipped += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(
+                        f'Рецепт {futures[future]}: {error}'
+                    )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {rendered}, уже в кэше: {skipped}, ошибок: {failed}'
+        ))
@@ -0,0 +1,42 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+INGREDIENT_INDEX = 'ingredient_name_trgm'
+RECIPE_INDEX = 'recipe_search_vector'
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(Ingredient, GinIndex(
+        fields=['name'], opclasses=['gin_trgm_ops'],
+        name=INGREDIENT_INDEX
+    ), concurrently=True)
+    schema_editor.add_index(Recipe, GinIndex(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('text', weight='B', config='russian'),
+        name=RECIPE_INDEX
+    ), concurrently=True)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index in (INGREDIENT_INDEX, RECIPE_INDEX):
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0003_shoppingcarttotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
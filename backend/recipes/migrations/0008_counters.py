@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    counters = (
+        (Recipe, 'favorites_count', apps.get_model('recipes', 'Favorite'),
+         'recipe'),
+        (Recipe, 'in_carts_count', apps.get_model('recipes', 'ShoppingList'),
+         'recipe'),
+        (CustomUser, 'recipes_count', Recipe, 'author'),
+        (CustomUser, 'followers_count', apps.get_model('recipes', 'Follow'),
+         'author'),
+    )
+    for model, field, source, source_field in counters:
+        model.objects.update(**{field: Coalesce(Subquery(
+            source.objects.filter(
+                **{source_field: OuterRef('pk')}
+            ).order_by().values(source_field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+        ('recipes', '0007_recipe_tags_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
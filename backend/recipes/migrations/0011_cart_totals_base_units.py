@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def to_base_units(apps, schema_editor):
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    for unit, (base, factor) in CONVERSIONS.items():
+        ShoppingCartTotal.objects.filter(measurement_unit=unit).update(
+            measurement_unit=base, amount=models.F('amount') * factor
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shoppinglist_servings'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_base_units, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations, models
+from django.db.models.functions import Cast, Upper
+
+# RecipeFilter.search ORs name__trigram_similar ("name" % term), served by
+# a trigram index on the raw column. IngredientFilter.search ORs
+# name__icontains, which compiles to UPPER("name"::text) LIKE UPPER(term)
+# and needs the index over that expression.
+RECIPE_NAME_INDEX = 'recipe_name_trgm'
+INGREDIENT_UPPER_INDEX = 'ingredient_name_upper_trgm'
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    schema_editor.add_index(Recipe, GinIndex(
+        fields=['name'], opclasses=['gin_trgm_ops'],
+        name=RECIPE_NAME_INDEX
+    ), concurrently=True)
+    schema_editor.add_index(Ingredient, GinIndex(
+        OpClass(
+            Upper(Cast('name', output_field=models.TextField())),
+            name='gin_trgm_ops'
+        ),
+        name=INGREDIENT_UPPER_INDEX
+    ), concurrently=True)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index in (RECIPE_NAME_INDEX, INGREDIENT_UPPER_INDEX):
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0011_cart_totals_base_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
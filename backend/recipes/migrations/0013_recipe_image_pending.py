@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_pending',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Фото ждёт обработки'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The tag filter is served by the unique (recipe_id, tag_id) index and
+# the tag_id foreign key index of the m2m table. The (tag_id, recipe_id)
+# index from 0007 duplicates them and only costs writes. Dropped and
+# restored concurrently on PostgreSQL, so the table is not locked.
+INDEX = 'recipe_tags_tag_recipe_idx'
+
+
+def concurrently(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return 'CONCURRENTLY '
+    return ''
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(
+        f'DROP INDEX {concurrently(schema_editor)}IF EXISTS {INDEX}'
+    )
+
+
+def create_index(apps, schema_editor):
+    schema_editor.execute(
+        f'CREATE INDEX {concurrently(schema_editor)}IF NOT EXISTS {INDEX} '
+        f'ON recipes_recipe_tags (tag_id, recipe_id)'
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0013_recipe_image_pending'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_index, create_index),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 
 from users.models import CustomUser
@@ -59,6 +60,8 @@ class Recipe(models.Model):
     name = models.CharField(max_length=200, verbose_name='Название рецепта')
     image = models.ImageField(
         verbose_name="Фото блюда", upload_to='recipes/')
+    image_pending = models.BooleanField(
+        default=False, db_index=True, verbose_name='Фото ждёт обработки')
     text = models.TextField(verbose_name='Описание рецепта')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -71,13 +74,29 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Дата добавления', auto_now_add=True, db_index=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления')
+    favorites_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name='В списках покупок')
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -120,6 +139,10 @@ class ShoppingList(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
         related_name='customers', verbose_name='Покупка')
+    servings = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)],
+        verbose_name='Порции'
+    )
     when_added = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата добавления'
     )
@@ -178,3 +201,31 @@ class Favorite(models.Model):
                 name='unique_recipe_user_in_favorite'
             )
         ]
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE,
+        related_name='cart_totals', verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='cart_totals', verbose_name='Ингредиент')
+    measurement_unit = models.CharField(
+        max_length=200, verbose_name='Единица измерения'
+    )
+    amount = models.PositiveIntegerField(
+        default=0, verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient', 'measurement_unit'],
+                name='unique_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
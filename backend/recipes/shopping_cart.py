@@ -0,0 +1,201 @@
+"""Incremental maintenance of the materialized ShoppingCartTotal rows.
+
+Amounts are scaled by the servings of each cart entry and stored in the
+base unit of the ingredient (г for кг, мл for л, see units.CONVERSIONS).
+
+The API applies deltas inside explicit(). Other deletes of cart entries
+and recipe ingredients, such as admin deletes or cascades, send
+post_delete, and the receivers in recipes.signals rebuild the totals of
+the affected users after the commit. A removal that would take a total
+below zero means the totals had drifted. It is logged, and those users
+are rebuilt too.
+"""
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
+from django.dispatch import Signal
+
+from . import units
+from .models import (Ingredient, IngredientInRecipe, ShoppingCartTotal,
+                     ShoppingList)
+
+logger = logging.getLogger(__name__)
+
+_explicit = ContextVar('cart_totals_explicit', default=False)
+
+# Sent with the ids of the users whose totals changed, or None when the
+# totals of every user were rebuilt. The writes bypass the model signals.
+totals_changed = Signal()
+
+
+@contextmanager
+def explicit():
+    """Deletes inside apply their cart deltas themselves."""
+    token = _explicit.set(True)
+    try:
+        yield
+    finally:
+        _explicit.reset(token)
+
+
+def is_explicit():
+    return _explicit.get()
+
+
+class PendingRebuild:
+    """on_commit callback collecting the users of one transaction."""
+
+    def __init__(self):
+        self.user_ids = set()
+
+    def __call__(self):
+        rebuild(sorted(self.user_ids))
+
+
+def schedule_rebuild(user_ids):
+    """Rebuild the totals of the users once the transaction commits."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    pending = next((
+        callback for _, callback in transaction.get_connection().run_on_commit
+        if isinstance(callback, PendingRebuild)
+    ), None)
+    if pending is not None:
+        pending.user_ids.update(user_ids)
+        return
+    pending = PendingRebuild()
+    pending.user_ids.update(user_ids)
+    transaction.on_commit(pending)
+
+
+def recipe_amounts(recipe):
+    return {
+        ingredient_id: amount or 0
+        for ingredient_id, amount in IngredientInRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount')
+    }
+
+
+def _apply(user_ids, deltas):
+    """Add per-ingredient deltas to the cart totals of the given users."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    base_units = {
+        ingredient_id: units.to_base(unit)
+        for ingredient_id, unit in Ingredient.objects.filter(
+            id__in=deltas
+        ).values_list('id', 'measurement_unit')
+    }
+    deltas = {
+        ingredient_id: delta * base_units[ingredient_id][1]
+        for ingredient_id, delta in deltas.items()
+    }
+    ShoppingCartTotal.objects.bulk_create([
+        ShoppingCartTotal(
+            user_id=user_id, ingredient_id=ingredient_id,
+            measurement_unit=base_units[ingredient_id][0]
+        )
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items() if delta > 0
+    ], ignore_conflicts=True)
+    totals = ShoppingCartTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas
+    )
+    new_amount = F('amount') + Case(
+        *[When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField()
+    )
+    if any(delta < 0 for delta in deltas.values()):
+        drifted = set(totals.annotate(new_amount=new_amount).filter(
+            new_amount__lt=0
+        ).values_list('user_id', flat=True))
+        if drifted:
+            logger.warning(
+                'Итоги списков покупок разошлись с корзиной у '
+                'пользователей %s, пересчитываются', sorted(drifted)
+            )
+            schedule_rebuild(drifted)
+    totals.update(amount=Greatest(new_amount, Value(0)))
+    totals.filter(amount=0).delete()
+    totals_changed.send(sender=ShoppingCartTotal, user_ids=list(user_ids))
+
+
+def recipes_amounts(servings):
+    """Summed ingredient amounts of {recipe_id: servings}, scaled."""
+    amounts = defaultdict(int)
+    for recipe_id, ingredient_id, amount in IngredientInRecipe.objects.filter(
+        recipe_id__in=servings
+    ).values_list('recipe_id', 'ingredient_id', 'amount'):
+        amounts[ingredient_id] += (amount or 0) * servings[recipe_id]
+    return amounts
+
+
+def add_recipes(user, servings):
+    _apply([user.id], recipes_amounts(servings))
+
+
+def remove_recipes(user, servings):
+    _apply([user.id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipes_amounts(servings).items()
+    })
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    """Propagate a change of recipe ingredients to every cart holding it."""
+    users_by_servings = defaultdict(list)
+    for user_id, servings in ShoppingList.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', 'servings'):
+        users_by_servings[servings].append(user_id)
+    for servings, user_ids in users_by_servings.items():
+        _apply(user_ids, {
+            ingredient_id: servings * (new_amounts.get(ingredient_id, 0)
+                                       - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        })
+
+
+@transaction.atomic
+def rebuild(user_ids=None, batch_size=1000):
+    """Recompute cart totals from ShoppingList, returns rows written."""
+    totals = ShoppingCartTotal.objects.all()
+    carts = {'recipe__customers__isnull': False}
+    if user_ids is not None:
+        totals = totals.filter(user_id__in=user_ids)
+        carts = {'recipe__customers__user__in': user_ids}
+    rows = IngredientInRecipe.objects.filter(**carts).values(
+        'ingredient_id',
+        user_id=F('recipe__customers__user'),
+        measurement_unit=units.base_unit('ingredient__measurement_unit')
+    ).annotate(total=Sum(
+        Cast('amount', IntegerField()) * F('recipe__customers__servings')
+        * units.base_factor('ingredient__measurement_unit')
+    )).filter(total__gt=0).order_by()
+    totals.delete()
+    written = 0
+    batch = []
+    for row in rows.iterator():
+        batch.append(ShoppingCartTotal(
+            user_id=row['user_id'], ingredient_id=row['ingredient_id'],
+            measurement_unit=row['measurement_unit'], amount=row['total']
+        ))
+        if len(batch) >= batch_size:
+            ShoppingCartTotal.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    ShoppingCartTotal.objects.bulk_create(batch)
+    totals_changed.send(sender=ShoppingCartTotal, user_ids=user_ids)
+    return written + len(batch)
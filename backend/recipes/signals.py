@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, ingredient_index, shopping_cart
+from .models import (Favorite, Follow, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingList)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        model, key, field = counters.COUNTED[sender]
+        counters.change(model, [getattr(instance, key)], field, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    model, key, field = counters.COUNTED[sender]
+    counters.change(model, [getattr(instance, key)], field, -1)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def rebuild_cart_of_user(sender, instance, **kwargs):
+    if not shopping_cart.is_explicit():
+        shopping_cart.schedule_rebuild([instance.user_id])
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def rebuild_carts_with_recipe(sender, instance, **kwargs):
+    if not shopping_cart.is_explicit():
+        shopping_cart.schedule_rebuild(ShoppingList.objects.filter(
+            recipe_id=instance.recipe_id
+        ).values_list('user_id', flat=True))
@@ -0,0 +1,240 @@
+"""Idempotent favorites, shopping cart entries and subscriptions.
+
+On PostgreSQL a toggle is one statement: INSERT ... SELECT ... ON
+CONFLICT DO NOTHING or a filtered DELETE, both RETURNING the affected
+target ids, so concurrent requests can neither fail on the unique
+constraint nor count a row twice. Other databases read the existing rows
+first and insert with bulk_create(ignore_conflicts=True).
+
+Cart entries added with explicit servings are upserted instead: an
+entry that is already in the cart takes the new servings, and the cart
+totals get the difference.
+
+Neither path sends model signals, so the counters and the cart totals
+are updated here from the returned ids and servings, and toggled is
+sent with the model as sender and the user whose rows changed.
+"""
+from collections import defaultdict
+
+from django.db import connection
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import counters, shopping_cart
+from .models import Favorite, Follow, ShoppingList
+
+toggled = Signal()
+
+TARGETS = {
+    Favorite: 'recipe',
+    ShoppingList: 'recipe',
+    Follow: 'author',
+}
+
+
+def _columns(model, values):
+    """Target field and {column: value} of the other inserted columns.
+
+    Raw inserts get neither auto_now_add nor Python-side defaults, so
+    both are filled in here.
+    """
+    target = model._meta.get_field(TARGETS[model])
+    columns = {}
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now_add', False):
+            columns[field.column] = timezone.now()
+        elif field.has_default() and not field.primary_key:
+            columns[field.column] = field.get_default()
+    for name, value in values.items():
+        columns[model._meta.get_field(name).column] = value
+    return target, columns
+
+
+def _insert_postgresql(model, user_id, target_ids, values):
+    target, extra = _columns(model, values)
+    columns = ', '.join(['user_id', target.column, *extra])
+    selected = ', '.join(['%s', 'id', *['%s'] * len(extra)])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} ({columns}) '
+            f'SELECT {selected} '
+            f'FROM {target.related_model._meta.db_table} '
+            f'WHERE id = ANY(%s) '
+            f'ON CONFLICT DO NOTHING RETURNING {target.column}',
+            [user_id, *extra.values(), list(target_ids)]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _insert_generic(model, user_id, target_ids, values):
+    target = model._meta.get_field(TARGETS[model])
+    existing = set(model.objects.filter(
+        user_id=user_id, **{f'{target.name}__in': target_ids}
+    ).values_list(target.attname, flat=True))
+    added = list(target.related_model.objects.filter(
+        pk__in=target_ids
+    ).exclude(pk__in=existing).values_list('pk', flat=True))
+    model.objects.bulk_create([
+        model(user_id=user_id, **{target.attname: target_id}, **values)
+        for target_id in added
+    ], ignore_conflicts=True)
+    return added
+
+
+def _upsert_servings_postgresql(user_id, servings, recipe_ids):
+    """{recipe_id: old servings, 0 if added}, unchanged ones skipped.
+
+    The existing entries are locked and read first, so their servings
+    can not change before the upsert. A row inserted by a concurrent
+    transaction after that read is updated too, its old servings are
+    unknown and reported as None.
+    """
+    target, extra = _columns(ShoppingList, {'servings': servings})
+    table = ShoppingList._meta.db_table
+    columns = ', '.join(['user_id', target.column, *extra])
+    selected = ', '.join(['%s', 'id', *['%s'] * len(extra)])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {target.column}, servings FROM {table} '
+            f'WHERE user_id = %s AND {target.column} = ANY(%s) FOR UPDATE',
+            [user_id, list(recipe_ids)]
+        )
+        old = dict(cursor.fetchall())
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {selected} '
+            f'FROM {target.related_model._meta.db_table} '
+            f'WHERE id = ANY(%s) '
+            f'ON CONFLICT (user_id, {target.column}) DO UPDATE '
+            f'SET servings = EXCLUDED.servings '
+            f'WHERE {table}.servings <> EXCLUDED.servings '
+            f'RETURNING {target.column}, xmax = 0',
+            [user_id, *extra.values(), list(recipe_ids)]
+        )
+        return {
+            recipe_id: 0 if inserted else old.get(recipe_id)
+            for recipe_id, inserted in cursor.fetchall()
+        }
+
+
+def _upsert_servings_generic(user_id, servings, recipe_ids):
+    entries = ShoppingList.objects.select_for_update().filter(
+        user_id=user_id, recipe_id__in=recipe_ids
+    )
+    existing = dict(entries.values_list('recipe_id', 'servings'))
+    changed = {
+        recipe_id: old for recipe_id, old in existing.items()
+        if old != servings
+    }
+    entries.filter(recipe_id__in=changed).update(servings=servings)
+    for recipe_id in _insert_generic(
+            ShoppingList, user_id, recipe_ids, {'servings': servings}):
+        changed[recipe_id] = 0
+    return changed
+
+
+def _delete(model, user_id, target_ids):
+    """Delete rows, returns {target_id: servings} of the deleted ones."""
+    target = model._meta.get_field(TARGETS[model])
+    servings = 'servings' if model is ShoppingList else '1'
+    table = model._meta.db_table
+    where = (f'WHERE user_id = %s AND {target.column} IN '
+             f'({", ".join(["%s"] * len(target_ids))})')
+    params = [user_id, *target_ids]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'DELETE FROM {table} {where} '
+                f'RETURNING {target.column}, {servings}', params
+            )
+            return dict(cursor.fetchall())
+        cursor.execute(
+            f'SELECT {target.column}, {servings} FROM {table} {where}',
+            params
+        )
+        removed = dict(cursor.fetchall())
+        cursor.execute(f'DELETE FROM {table} {where}', params)
+        return removed
+
+
+def _counter(model):
+    counted, _, field = counters.COUNTED[model]
+    return counted, field
+
+
+def add(model, user, target_ids, **values):
+    """Add rows for the given targets, returns the ids actually added.
+
+    Extra column values, such as servings of a cart entry, are the same
+    for every added row. Unknown and already added ids are skipped. The
+    caller owns the transaction.
+    """
+    target_ids = set(target_ids)
+    if not target_ids:
+        return []
+    if connection.vendor == 'postgresql':
+        added = _insert_postgresql(model, user.id, target_ids, values)
+    else:
+        added = _insert_generic(model, user.id, target_ids, values)
+    if added:
+        counted, field = _counter(model)
+        counters.change(counted, added, field, 1)
+        if model is ShoppingList:
+            servings = values.get('servings', 1)
+            shopping_cart.add_recipes(
+                user, dict.fromkeys(added, servings)
+            )
+        toggled.send(sender=model, user=user)
+    return added
+
+
+def set_servings(user, servings):
+    """Upsert cart entries of {recipe_id: servings}, returns added ids.
+
+    Entries already in the cart take the new servings and the cart totals
+    get the difference. Unknown ids are skipped. The caller owns the
+    transaction.
+    """
+    recipe_ids_by_servings = defaultdict(list)
+    for recipe_id, value in servings.items():
+        recipe_ids_by_servings[value].append(recipe_id)
+    if connection.vendor == 'postgresql':
+        upsert = _upsert_servings_postgresql
+    else:
+        upsert = _upsert_servings_generic
+    added, deltas, unknown = [], {}, False
+    for value, recipe_ids in recipe_ids_by_servings.items():
+        for recipe_id, old in upsert(user.id, value, recipe_ids).items():
+            if old is None:
+                unknown = True
+                continue
+            if not old:
+                added.append(recipe_id)
+            deltas[recipe_id] = value - old
+    if added:
+        counted, field = _counter(ShoppingList)
+        counters.change(counted, added, field, 1)
+    shopping_cart.add_recipes(user, deltas)
+    if unknown:
+        shopping_cart.schedule_rebuild([user.id])
+    if deltas or unknown:
+        toggled.send(sender=ShoppingList, user=user)
+    return added
+
+
+def remove(model, user, target_ids):
+    """Remove rows for the given targets, returns the ids actually removed.
+
+    The caller owns the transaction.
+    """
+    target_ids = set(target_ids)
+    if not target_ids:
+        return []
+    removed = _delete(model, user.id, list(target_ids))
+    if removed:
+        counted, field = _counter(model)
+        counters.change(counted, list(removed), field, -1)
+        if model is ShoppingList:
+            shopping_cart.remove_recipes(user, removed)
+        toggled.send(sender=model, user=user)
+    return list(removed)
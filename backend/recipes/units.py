@@ -0,0 +1,28 @@
+"""Conversion of measurement units to a common base unit."""
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def to_base(unit):
+    """(base unit, factor), units without a conversion map to themselves."""
+    return CONVERSIONS.get(unit, (unit, 1))
+
+
+def base_unit(unit_field):
+    return Case(
+        *[When(**{unit_field: unit}, then=Value(base))
+          for unit, (base, _) in CONVERSIONS.items()],
+        default=F(unit_field), output_field=CharField()
+    )
+
+
+def base_factor(unit_field):
+    return Case(
+        *[When(**{unit_field: unit}, then=Value(factor))
+          for unit, (_, factor) in CONVERSIONS.items()],
+        default=Value(1), output_field=IntegerField()
+    )
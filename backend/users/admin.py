@@ -5,6 +5,7 @@ from .models import CustomUser
 
 class UserAdmin(admin.ModelAdmin):
     list_filter = ('username', 'email')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
 admin.site.register(CustomUser, UserAdmin)
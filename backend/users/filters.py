@@ -0,0 +1,17 @@
+from django.db.models import Q
+from django_filters import rest_framework as filters
+
+from .models import CustomUser
+
+
+class UserFilter(filters.FilterSet):
+    search = filters.CharFilter(method='get_search')
+
+    class Meta:
+        model = CustomUser
+        fields = ('search',)
+
+    def get_search(self, queryset, name, value):
+        return queryset.filter(
+            Q(username__icontains=value) | Q(email__icontains=value)
+        )
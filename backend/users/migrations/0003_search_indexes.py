@@ -0,0 +1,44 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations, models
+from django.db.models.functions import Cast, Upper
+
+# icontains on PostgreSQL compiles to UPPER(field::text) LIKE UPPER(%s),
+# trigram indexes over the same expression serve it.
+INDEXES = {
+    'username': 'user_username_upper_trgm',
+    'email': 'user_email_upper_trgm',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    CustomUser = apps.get_model('users', 'CustomUser')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field, name in INDEXES.items():
+        schema_editor.add_index(CustomUser, GinIndex(
+            OpClass(
+                Upper(Cast(field, output_field=models.TextField())),
+                name='gin_trgm_ops'
+            ),
+            name=name
+        ), concurrently=True)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index in INDEXES.values():
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
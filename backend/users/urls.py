@@ -1,6 +1,12 @@
 from django.urls import include, path
+from rest_framework.routers import SimpleRouter
+
+from .views import CustomUserViewSet
+
+router = SimpleRouter()
+router.register('users', CustomUserViewSet)
 
 urlpatterns = [
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
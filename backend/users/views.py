@@ -0,0 +1,22 @@
+from djoser.views import UserViewSet
+from django.db.models import BooleanField, Exists, OuterRef, Value
+
+from recipes.models import Follow
+
+from .filters import UserFilter
+
+
+class CustomUserViewSet(UserViewSet):
+    """djoser users with is_subscribed resolved in the list query."""
+    filterset_class = UserFilter
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('id')
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('pk'))
+        ))